@@ -0,0 +1,137 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from rich.table import Table
+import config
+from exporters import WRITERS
+from main import logger, console, process_file, output_names
+
+# --- Пакетная обработка выгрузок за несколько недель ---
+def collect_inputs(source: str) -> list[str]:
+    """Папка (все *.xlsx в ней) или glob-шаблон; временные файлы Excel (~$...) пропускаются"""
+    pattern = os.path.join(source, "*.xlsx") if os.path.isdir(source) else source
+    files = glob.glob(pattern, recursive=True)
+    return sorted(f for f in files if os.path.isfile(f) and not os.path.basename(f).startswith("~$"))
+
+def process_export(input_file: str, output_ao: str, output_blag: str, export_base: str,
+                   exports: list[str] | None = None) -> dict:
+    """Полный цикл для одной выгрузки; ошибка возвращается в результате, а не пробрасывается"""
+    start = time.perf_counter()
+    summary = {"file": input_file, "rows": 0, "seconds": 0.0, "error": None}
+    try:
+        # выгрузки уже обрабатываются параллельно, вложенный пул процессов не нужен
+        rows = process_file(input_file, output_ao, output_blag, export_base, exports, workers=1)
+        if rows is None:
+            summary["error"] = "файл не найден"
+        else:
+            summary["rows"] = rows
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+def _init_worker():
+    # в рабочих процессах оставляем только предупреждения, чтобы логи разных недель не перемешивались
+    logging.getLogger("population_analysis").setLevel(logging.WARNING)
+
+def _failed(input_file: str, error: str) -> dict:
+    return {"file": input_file, "rows": 0, "seconds": 0.0, "error": error}
+
+def _run_pool(input_files: list[str], names: dict, workers: int | None, exports: list[str] | None,
+              results: list[dict]) -> list[str]:
+    """Обрабатывает выгрузки в одном пуле; возвращает незавершенные (в порядке input_files),
+    если рабочий процесс аварийно завершился (OOM, сбой разбора XLSX) и пул сломался"""
+    unfinished = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {executor.submit(process_export, f, *names[f], exports): f for f in input_files}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except BrokenProcessPool:
+                unfinished.append(futures[future])
+                continue
+            except Exception as e:
+                summary = _failed(futures[future], f"{type(e).__name__}: {e}")
+            status = "ошибка: " + summary["error"] if summary["error"] else "готово"
+            logger.info(f"{summary['file']}: {status}")
+            results.append(summary)
+    return sorted(unfinished, key=input_files.index)
+
+def run_batch(input_files: list[str], out_dir: str, workers: int | None = None,
+              exports: list[str] | None = None) -> list[dict]:
+    """Выгрузки обрабатываются в пуле процессов. Если рабочий процесс аварийно завершился, пул
+    сломан и все незавершенные задания получают BrokenProcessPool: тогда выгрузки, которые могли
+    быть в работе, перезапускаются по одной в отдельном процессе, чтобы найти упавшую,
+    а остальные - снова параллельно в новом пуле"""
+    os.makedirs(out_dir, exist_ok=True)
+    names = output_names(input_files, out_dir)
+    results = []
+    pending, suspects = list(input_files), []
+    while pending or suspects:
+        if suspects:
+            # с одним процессом выгрузки идут по порядку: упала первая незавершенная
+            unfinished = _run_pool(suspects, names, 1, exports, results)
+            if unfinished:
+                logger.error(f"{unfinished[0]}: рабочий процесс аварийно завершился")
+                results.append(_failed(unfinished[0], "рабочий процесс аварийно завершился"))
+            suspects = unfinished[1:]
+            continue
+        unfinished = _run_pool(pending, names, workers, exports, results)
+        # задания передаются процессам по порядку, поэтому в работе могли быть
+        # только первые workers + 1 незавершенных (одно ждет в очереди вызовов)
+        in_flight = (workers or os.cpu_count() or 1) + 1
+        suspects, pending = unfinished[:in_flight], unfinished[in_flight:]
+        if unfinished:
+            logger.warning(f"Рабочий процесс аварийно завершился; выгрузок перезапускается: {len(unfinished)}")
+    results.sort(key=lambda s: input_files.index(s["file"]))
+    return results
+
+def print_summary(results: list[dict], wall_seconds: float):
+    table = Table(title="Пакетная обработка", title_style="bold magenta")
+    table.add_column("Файл", style="cyan")
+    table.add_column("Строк", justify="right")
+    table.add_column("Время, с", justify="right")
+    table.add_column("Строк/с", justify="right")
+    table.add_column("Статус")
+    for s in results:
+        rate = s["rows"] / s["seconds"] if s["seconds"] else 0
+        status = f"[red]{s['error']}[/red]" if s["error"] else "[green]готово[/green]"
+        table.add_row(os.path.basename(s["file"]), str(s["rows"]), f"{s['seconds']:.2f}", f"{rate:.0f}", status)
+    total_rows = sum(s["rows"] for s in results)
+    failed = sum(1 for s in results if s["error"])
+    table.caption = (f"Файлов: {len(results)}, ошибок: {failed}, строк: {total_rows}, "
+                     f"общее время: {wall_seconds:.2f} с, {total_rows / wall_seconds if wall_seconds else 0:.0f} строк/с")
+    console.print(table)
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Пакетная обработка недельных выгрузок СНЕО")
+    parser.add_argument("source", help="папка с выгрузками или glob-шаблон, например 'exports/*.xlsx'")
+    parser.add_argument("--out-dir", default=config.BATCH_OUTPUT_DIR, help="папка для отчетов")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument("--summary", help="сохранить сводку в JSON")
+    parser.add_argument("--export", nargs="+", choices=sorted(WRITERS), default=config.EXPORT_FORMATS,
+                        metavar="FORMAT", help="выгрузить результаты каждой недели также в json/csv/parquet")
+    args = parser.parse_args(argv)
+
+    input_files = collect_inputs(args.source)
+    if not input_files:
+        logger.error(f"Не найдено выгрузок по пути {args.source}")
+        return 1
+    logger.info(f"Выгрузок к обработке: {len(input_files)}")
+    start = time.perf_counter()
+    results = run_batch(input_files, args.out_dir, args.workers, args.export)
+    wall_seconds = time.perf_counter() - start
+    print_summary(results, wall_seconds)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump({"wall_seconds": wall_seconds, "files": results}, f, ensure_ascii=False, indent=2)
+    return 1 if any(s["error"] for s in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
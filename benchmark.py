@@ -0,0 +1,176 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import Workbook
+from rich.table import Table
+import config
+import main as pipeline
+from main import logger, console
+from profiling import peak_rss_mb
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# --- Генератор синтетической выгрузки Report060U ---
+def _messy(value: str, rnd: random.Random) -> str:
+    """Варианты написания, которые встречаются в реальных выгрузках"""
+    roll = rnd.random()
+    if roll < 0.05:
+        return f"  {value} "
+    if roll < 0.08:
+        return value.upper()
+    if roll < 0.10:
+        return value.lower()
+    return value
+
+def _vocabularies() -> dict:
+    statuses = [s for keywords in config.SOCIAL_GROUPS.values() for s in keywords]
+    statuses += [f"{kw}, {extra}" for kw in config.KEYWORD_MAPPING for extra in ("1 группа", "№12")]
+    statuses += ["работает", "ИП", "водитель"]
+    districts = list(config.ADM_TERR) + list(config.DISTRICT_NORMALIZATION)
+    med_orgs = list(config.MED_ORG) + [f"ГБУЗ АО {d.replace(' район', 'ая')} больница" for d in config.ADM_TERR[1:]]
+    places = [p for ps in config.SEVERITY_CATEGORIES.values() for p in ps] + ["Реанимация"]
+    return {"statuses": statuses, "districts": districts, "med_orgs": med_orgs, "places": places}
+
+def generate_export(path: str, rows: int, seed: int = 42):
+    """Пишет xlsx той же структуры, что выгрузка СНЕО: 3 строки заголовка и 39 столбцов"""
+    rnd = random.Random(seed)
+    vocab = _vocabularies()
+    col = {name: i for i, name in enumerate(config.COLUMN_NAMES) if name}
+    season_start = datetime.datetime(2024, 9, 1)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Report060U")
+    ws.append(["Отчет по форме 060/у (синтетические данные)"])
+    ws.append([])
+    ws.append([name or "-" for name in config.COLUMN_NAMES])
+    for i in range(rows):
+        # столбцы, которые предобработка удаляет, в выгрузке тоже заполнены
+        row = ["-" if name is None else None for name in config.COLUMN_NAMES]
+        submit = season_start + datetime.timedelta(days=rnd.randint(0, 240), hours=rnd.randint(8, 18))
+        birth = submit - datetime.timedelta(days=rnd.randint(0, 95 * 365))
+        row[col["Номер ЭИ"]] = 1_000_000 + i
+        row[col[config.COL_SUBMIT_DATE]] = submit if rnd.random() < 0.9 else submit.strftime("%d.%m.%Y")
+        row[col[config.COL_MED_ORG]] = None if rnd.random() < 0.01 else _messy(rnd.choice(vocab["med_orgs"]), rnd)
+        row[col["ФИО заболевшего"]] = f"Пациент {i}"
+        row[col[config.COL_BIRTH_DATE]] = None if rnd.random() < 0.02 else birth
+        row[col[config.COL_DISTRICT]] = None if rnd.random() < 0.01 else _messy(rnd.choice(vocab["districts"]), rnd)
+        row[col["Полный адрес"]] = f"ул. Синтетическая, д. {rnd.randint(1, 200)}, кв. {rnd.randint(1, 300)}"
+        status = None if rnd.random() < 0.15 else _messy(rnd.choice(vocab["statuses"]), rnd)
+        row[col[config.COL_SOCIAL_STATUS]] = status
+        # статус иногда заполнен только в соседнем столбце, как в реальных выгрузках
+        row[col["Место работы/учебы"]] = _messy(rnd.choice(vocab["statuses"]), rnd) if status is None else "МБОУ СОШ"
+        row[col["Дата заболевания"]] = submit - datetime.timedelta(days=rnd.randint(0, 7))
+        row[col["Предварительный диагноз"]] = "J18.9 Пневмония неуточненная"
+        if rnd.random() < 0.4:
+            row[col[config.COL_HOSP_DATE]] = submit + datetime.timedelta(days=rnd.randint(0, 2))
+        row[col[config.COL_HOSP_PLACE]] = None if rnd.random() < 0.05 else _messy(rnd.choice(vocab["places"]), rnd)
+        row[col["Примечание"]] = None if rnd.random() < 0.8 else "повторная подача"
+        ws.append(row)
+    wb.save(path)
+
+def ensure_export(data_dir: str, rows: int, seed: int) -> str:
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"report060u_{rows}_{seed}.xlsx")
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        generate_export(path, rows, seed)
+        logger.info(f"Сгенерирована выгрузка {path} ({rows} строк) за {time.perf_counter() - start:.1f} с")
+    return path
+
+# --- Замеры ---
+def run_size(path: str, rows: int, compact: bool = False) -> dict:
+    """Замер одной выгрузки; выполняется в отдельном процессе, чтобы пик памяти не смешивался"""
+    logging.getLogger("population_analysis").setLevel(logging.WARNING)
+
+    stages = {}
+
+    def timed(name, func, *args):
+        start = time.perf_counter()
+        value = func(*args)
+        seconds = time.perf_counter() - start
+        stages[name] = {"seconds": round(seconds, 4),
+                        "rows_per_sec": round(rows / seconds) if seconds else None,
+                        "peak_rss_mb": peak_rss_mb()}
+        return value
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        df = timed("preprocess_file", pipeline.preprocess_file, path, False, False)
+        stages["preprocess_file"]["frame_memory_mb"] = round(pipeline.frame_memory_mb(df), 2)
+        if compact:
+            # та же выгрузка в компактном режиме: сравнение времени чтения и объема таблицы
+            compact_df = timed("preprocess_file --compact", pipeline.preprocess_file, path, False, True)
+            stages["preprocess_file --compact"]["frame_memory_mb"] = round(pipeline.frame_memory_mb(compact_df), 2)
+            del compact_df
+        result_regions = timed("analyze_population_full", pipeline.analyze_population_full, df)
+        result_med_orgs = timed("analyze_by_med_org", pipeline.analyze_by_med_org, df)
+        timed("fill_report", pipeline.fill_report, result_regions, config.TEMPLATE_FILE_AO,
+              os.path.join(out_dir, config.OUTPUT_FILE_AO))
+        timed("fill_report_by_med_org", pipeline.fill_report_by_med_org, result_med_orgs, config.TEMPLATE_FILE_BLAG,
+              os.path.join(out_dir, config.OUTPUT_FILE_BLAG))
+    return {"rows": rows, "parsed_rows": len(df), "stages": stages, "peak_rss_mb": peak_rss_mb()}
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results: list[dict]):
+    for res in results:
+        peak = "" if res["peak_rss_mb"] is None else f", пик памяти {res['peak_rss_mb']:.1f} МБ"
+        table = Table(title=f"{res['rows']} строк{peak}", title_style="bold magenta")
+        for column in ("Этап", "Время, с", "Строк/с", "Пик RSS, МБ", "Таблица, МБ"):
+            table.add_column(column, justify="left" if column == "Этап" else "right")
+        for name, stage in res["stages"].items():
+            table.add_row(f"[cyan]{name}[/cyan]", f"{stage['seconds']:.3f}", str(stage["rows_per_sec"] or ""),
+                          "" if stage["peak_rss_mb"] is None else f"{stage['peak_rss_mb']:.1f}",
+                          str(stage.get("frame_memory_mb", "")))
+        console.print(table)
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Замер скорости этапов на синтетических выгрузках")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="размеры выгрузок в строках")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default="bench_data", help="папка для сгенерированных выгрузок")
+    parser.add_argument("--out", default="bench_results.json", help="JSON, в который дописывается результат")
+    parser.add_argument("--compact", action="store_true", help="дополнительно замерить компактную загрузку")
+    args = parser.parse_args(argv)
+
+    results = []
+    for rows in args.sizes:
+        path = ensure_export(args.data_dir, rows, args.seed)
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(run_size, path, rows, args.compact).result())
+    print_results(results)
+
+    run = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "compact": args.compact,
+        "results": results,
+    }
+    history = []
+    if os.path.exists(args.out):
+        with open(args.out, encoding="utf-8") as f:
+            history = json.load(f)
+    history.append(run)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+    logger.info(f"Результаты добавлены в {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
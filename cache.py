@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import pandas as pd
+import config
+
+try:
+    import pyarrow  # noqa: F401  (нужен pandas для Parquet)
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger("population_analysis")
+
+# Увеличивать при изменении логики предобработки, чтобы старые записи кэша не использовались
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".parquet"
+HASH_BLOCK_SIZE = 1 << 20
+
+# Типы столбцов, которые Parquet сохраняет без преобразования
+_STORABLE_TYPES = {"string", "empty", "integer", "floating", "mixed-integer-float", "boolean", "datetime", "date"}
+
+def is_available() -> bool:
+    return pyarrow is not None
+
+def _cache_dir() -> str:
+    return os.path.abspath(config.CACHE_DIR)
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def cache_key(path: str, compact: bool = False) -> str:
+    """Ключ кэша: содержимое файла + настройки, от которых зависит предобработанная таблица.
+    Названия территорий и МО хранятся до нормализации: она выполняется после загрузки из кэша"""
+    settings = {
+        "compact": [config.COMPACT_COLUMNS, config.CATEGORICAL_COLUMNS, config.DATE_FORMATS] if compact else False,
+        "version": CACHE_VERSION,
+        "column_names": config.COLUMN_NAMES,
+        "columns": [config.COL_SUBMIT_DATE, config.COL_BIRTH_DATE, config.COL_SOCIAL_STATUS, config.COL_DISTRICT,
+                    config.COL_WORKPLACE],
+    }
+    h = hashlib.sha256(file_digest(path).encode())
+    h.update(json.dumps(settings, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+def _entry_path(key: str) -> str:
+    return os.path.join(_cache_dir(), key + CACHE_SUFFIX)
+
+def load(key: str) -> pd.DataFrame | None:
+    if not is_available():
+        return None
+    path = _entry_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_parquet(path)
+    except FileNotFoundError:
+        return None  # запись вытеснил другой процесс пакетной обработки
+    except Exception as e:
+        logger.warning(f"Запись кэша {path} повреждена и будет удалена: {e}")
+        _remove(path)
+        return None
+    try:
+        os.utime(path)  # отметка использования для вытеснения давно не нужных записей
+    except FileNotFoundError:
+        pass
+    return df
+
+def storable_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Столбцы со смешанными типами (даты вперемешку с текстом и т.п.) сохраняются как текст"""
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            if pd.api.types.infer_dtype(df[col].cat.categories, skipna=True) not in _STORABLE_TYPES:
+                df[col] = df[col].astype(object).map(lambda v: v if pd.isna(v) else str(v)).astype("category")
+        elif df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in _STORABLE_TYPES:
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+def store(key: str, df: pd.DataFrame):
+    if not is_available():
+        return
+    os.makedirs(_cache_dir(), exist_ok=True)
+    path = _entry_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        storable_frame(df).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить кэш {path}: {e}")
+        if os.path.exists(tmp_path):
+            _remove(tmp_path)
+        return
+    evict()
+
+def _remove(path: str) -> bool:
+    """Удаляет запись кэша; запись, которую уже удалил другой процесс, считается удаленной"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        # в Windows запись, которую сейчас читает другой процесс, удалить нельзя
+        logger.warning(f"Не удалось удалить запись кэша {path}: {e}")
+        return False
+    return True
+
+def evict():
+    """Удаляет записи старше CACHE_MAX_AGE_DAYS, затем самые давние, пока кэш больше CACHE_MAX_BYTES"""
+    cache_dir = _cache_dir()
+    if not os.path.isdir(cache_dir):
+        return
+    now = time.time()
+    max_age = config.CACHE_MAX_AGE_DAYS * 24 * 3600
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(CACHE_SUFFIX):
+            continue
+        path = os.path.join(cache_dir, name)
+        # несколько процессов пакетной обработки вытесняют одни и те же записи одновременно
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if now - stat.st_mtime > max_age:
+            _remove(path)
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= config.CACHE_MAX_BYTES:
+            break
+        if _remove(path):
+            total -= size
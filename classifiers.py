@@ -0,0 +1,103 @@
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import config
+
+OTHER_MED_ORG = "Другие МО"
+
+# --- Поиск нескольких подстрок за один проход ---
+class SubstringMatcher:
+    """Возвращает метку первого (по порядку в конфиге) шаблона, найденного в строке"""
+
+    def __init__(self, patterns: list[tuple[str, str]]):
+        self.patterns = patterns
+        self.regex = re.compile("|".join(re.escape(p) for p, _ in patterns)) if patterns else None
+
+    def match(self, text: str) -> str | None:
+        if self.regex is None or self.regex.search(text) is None:
+            return None
+        # регулярное выражение только отсекает строки без совпадений,
+        # приоритет шаблонов определяется порядком в конфиге
+        for pattern, label in self.patterns:
+            if pattern in text:
+                return label
+        return None
+
+# --- Скомпилированные таблицы классификации ---
+class Classifier:
+    def __init__(self):
+        self.status_exact = {}
+        for group_name, keywords in config.SOCIAL_GROUPS.items():
+            for kw in keywords:
+                self.status_exact.setdefault(kw.lower(), group_name)
+        self.status_keywords = SubstringMatcher(
+            [(keyword.lower(), group) for keyword, group in config.KEYWORD_MAPPING.items()]
+        )
+        self.adult_override = frozenset(config.SOCIAL_GROUPS_ADULT_OVERRIDE)
+        self.med_org_keywords = SubstringMatcher(
+            [(kw, org) for org, keywords in config.MED_ORGS.items() for kw in keywords]
+        )
+        self.city_med_orgs = SubstringMatcher([(org.lower(), org) for org in config.MED_ORGS])
+        self.severity_lookup = {}
+        for cat, places in config.SEVERITY_CATEGORIES.items():
+            for place in places:
+                self.severity_lookup.setdefault(place, cat)
+
+    # --- Классификация одного значения ---
+    def status_group(self, status) -> str:
+        """Социальная группа без учета возраста"""
+        text = str(status).strip().lower()
+        group = self.status_exact.get(text)
+        if group is None:
+            group = self.status_keywords.match(text)
+        return group if group is not None else config.SOCIAL_GROUP_DEFAULT
+
+    def med_org(self, mo_name) -> str:
+        if not isinstance(mo_name, str):
+            return OTHER_MED_ORG
+        org = self.med_org_keywords.match(mo_name.lower())
+        return org if org is not None else OTHER_MED_ORG
+
+    def is_city_med_org(self, mo_name) -> bool:
+        """МО относится к отчету по Благовещенску (название содержит одну из MED_ORGS)"""
+        return self.city_med_orgs.match(str(mo_name).lower()) is not None
+
+    def severity(self, place) -> str:
+        return self.severity_lookup.get(str(place).strip(), config.SEVERITY_DEFAULT)
+
+    # --- Классификация столбцов (только уникальные значения) ---
+    def social_groups(self, status: pd.Series, age: pd.Series) -> pd.Series:
+        groups = map_unique(status, self.status_group)
+        adult = groups.isin(self.adult_override) & (age >= 18)
+        return groups.mask(adult, config.SOCIAL_GROUP_DEFAULT)
+
+    def med_orgs(self, names: pd.Series) -> pd.Series:
+        return map_unique(names, self.med_org)
+
+    def city_med_org_mask(self, names: pd.Series) -> pd.Series:
+        return map_unique(names, self.is_city_med_org).astype(bool)
+
+    def severities(self, places: pd.Series) -> pd.Series:
+        return map_unique(places, self.severity)
+
+_call_hook = None
+
+def set_call_hook(hook):
+    """hook(func, value, rows) -> метка; позволяет замерять отдельные вызовы (main.py --profile-classifiers)"""
+    global _call_hook
+    _call_hook = hook
+
+def map_unique(values: pd.Series, func) -> pd.Series:
+    """Применяет func к уникальным значениям и раскладывает результат обратно по строкам"""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    if _call_hook is None:
+        labels = np.array([func(v) for v in uniques], dtype=object)
+    else:
+        rows = np.bincount(codes, minlength=len(uniques))
+        labels = np.array([_call_hook(func, v, int(n)) for v, n in zip(uniques, rows)], dtype=object)
+    return pd.Series(labels[codes], index=values.index, dtype=object)
+
+@lru_cache(maxsize=None)
+def get_classifier() -> Classifier:
+    return Classifier()
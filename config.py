@@ -5,7 +5,54 @@ OUTPUT_FILE_AO = "shablon_ao_itog.xlsx"
 TEMPLATE_FILE_BLAG = "shablon_blag.xlsx"
 OUTPUT_FILE_BLAG = "shablon_blag_itog.xlsx"
 
+# --- Машиночитаемые выгрузки результатов (main.py --export) ---
+EXPORT_FORMATS = []     # "json", "csv", "parquet" - пишутся вместе с отчетами Excel
+EXPORT_FILE = "itog"    # расширение добавляется по формату
+OUTPUT_WORKERS = None   # потоков записи результатов (None - все отчеты и выгрузки одновременно)
+
+# --- Локальный сервис отчетов (service.py) ---
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8060
+SERVICE_WORKERS = 2             # выгрузок, обрабатываемых одновременно
+SERVICE_MAX_PENDING = 8         # запросов в очереди сверх этого получают 503
+SERVICE_MAX_UPLOAD_MB = 200
+SERVICE_TIMEOUT = 600           # секунд на одну выгрузку, дальше 504 и отмена обработки
+SERVICE_METRICS_WINDOW = 1000   # по скольким последним запросам считать время в /metrics
+
+# --- Графический интерфейс (gui.py) ---
+GUI_WORKERS = 1        # сколько файлов обрабатывать одновременно (1 - по очереди)
+GUI_STREAM = True      # потоковое чтение: прогресс по кускам и быстрая отмена
+
+# --- Пакетная обработка (batch.py) ---
+BATCH_OUTPUT_DIR = "batch_output"
+
+# --- Накопительное хранилище агрегатов (store.py) ---
+STORE_FILE = "aggregates.sqlite"
+
+# --- Потоковое чтение (main.py --stream) ---
+STREAM_CHUNK_ROWS = 10000       # строк выгрузки в одном куске
+
+# --- Список случаев с классификацией (main.py --line-list) ---
+LINE_LIST_FILE = "spisok_sluchaev.xlsx"
+LINE_LIST_PENDING_CHUNKS = 4    # кусков, ожидающих записи: память не растет, если запись отстает от анализа
+
+# --- Параллельный анализ одной выгрузки (main.py --workers) ---
+PARALLEL_WORKERS = 1            # процессов для классификации; 1 - в текущем процессе, None - по числу ядер
+PARALLEL_MIN_ROWS = 200000      # выгрузки меньше считаются в одном процессе: запуск пула дороже выигрыша
+PARALLEL_CHUNK_ROWS = 50000     # строк в куске, отправляемом в рабочий процесс
+
+# --- Кэш предобработанной выгрузки (Parquet, ключ - хэш файла и настроек столбцов) ---
+CACHE_ENABLED = True
+CACHE_DIR = ".cache"
+CACHE_MAX_BYTES = 500 * 1024 * 1024   # при превышении удаляются давно не использованные записи
+CACHE_MAX_AGE_DAYS = 30
+
+# --- Отладочная выгрузка предобработанной таблицы (main.py --dump) ---
+DEBUG_DUMP_FORMAT = None        # None - не сохранять; "csv", "parquet" или "xlsx"
+DEBUG_DUMP_FILE = "df_filtred"  # расширение добавляется по формату
+
 # --- Основные столбцы ---
+COL_CASE_ID = "Номер ЭИ"
 COL_SUBMIT_DATE = "Дата подачи ЭИ"
 COL_BIRTH_DATE = "Дата рождения"
 COL_SOCIAL_STATUS = "Социальный статус"
@@ -13,6 +60,31 @@ COL_DISTRICT = "Административная территория (горо
 COL_MED_ORG = "МО передавшая ЭИ"
 COL_HOSP_DATE = "Дата госпитализации"
 COL_HOSP_PLACE = "Место госпитализации"
+COL_WORKPLACE = "Место работы/учебы"   # из него дополняется пустой социальный статус
+COL_ONSET_DATE = "Дата заболевания"
+
+# --- Компактная загрузка (main.py --compact): только нужные анализу столбцы ---
+COMPACT_INGEST = False
+COMPACT_COLUMNS = [
+    COL_CASE_ID, COL_SUBMIT_DATE, COL_MED_ORG, COL_BIRTH_DATE, COL_DISTRICT,
+    COL_WORKPLACE, COL_SOCIAL_STATUS, COL_ONSET_DATE, COL_HOSP_DATE, COL_HOSP_PLACE,
+]
+CATEGORICAL_COLUMNS = [COL_DISTRICT, COL_MED_ORG, COL_SOCIAL_STATUS, COL_HOSP_PLACE]
+# форматы дат, записанных в выгрузке текстом; выбирается первый, который подходит ко всем значениям
+DATE_FORMATS = ["%d.%m.%Y", "%d.%m.%Y %H:%M", "%d.%m.%Y %H:%M:%S", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S"]
+
+# --- Динамика по дням и неделям (timeseries.py) ---
+TIMESERIES_DATE_COLUMN = COL_SUBMIT_DATE   # или COL_ONSET_DATE - по дате заболевания
+TIMESERIES_FILE = "dinamika.xlsx"
+TIMESERIES_ROLLING_DAYS = 7
+TIMESERIES_OTHER_DISTRICT = "Прочие"       # территории не из ADM_TERR и пустые
+TIMESERIES_ALERT_GROWTH = 0.5              # сигнал: рост за неделю на 50% и больше...
+TIMESERIES_ALERT_MIN_CASES = 10            # ...при числе случаев за неделю не меньше этого
+
+# --- Куб счетчиков для произвольных срезов (cube.py) ---
+CUBE_FILE = "kub.parquet"
+CUBE_DATE_COLUMN = COL_SUBMIT_DATE      # или COL_ONSET_DATE - по дате заболевания
+CUBE_MATCH_MIN_SCORE = 0.5              # значения фильтров сопоставляются со значениями куба по триграммам
 
 # --- Структура региона по умолчанию ---
 DEFAULT_REGION_STRUCTURE = {
@@ -56,6 +128,17 @@ COLUMN_NAMES = [
     None, None                          # 38–39 (УДАЛИТЬ)
 ]
 
+# --- Исправление написания административных территорий ---
+DISTRICT_NORMALIZATION = {
+    "Сковородино": "Сковородинский район",
+}
+
+# --- Нечеткое сопоставление территорий и МО со справочниками ADM_TERR и MED_ORG (normalization.py) ---
+NORMALIZATION_ENABLED = True
+NORMALIZATION_FILE = "normalization.json"   # выученные соответствия: повторные запуски только ищут в словаре
+NORMALIZATION_MIN_SCORE = {"district": 0.6, "med_org": 0.8}   # минимальное сходство по триграммам (0..1)
+NORMALIZATION_MIN_MARGIN = 0.1   # насколько лучший вариант должен опережать второй
+
 # --- азвания административных территорий ---
 ADM_TERR = [                   
     "Благовещенск",
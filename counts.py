@@ -0,0 +1,205 @@
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+import config
+from report_writer import layout_keys
+
+# --- Счетчики отчетов в массиве NumPy ---
+# Результат анализа - целочисленный массив [регион/МО, раздел, категория]. Порядок категорий
+# фиксирован (AGE_GROUP_NAME, SOCIAL_GROUP_ORDER, SEVERITY_ORDER), поэтому счетчики кусков,
+# процессов и недель складываются как массивы, а строки отчета берутся из него срезом.
+# Для старого кода CountTensor ведет себя как словарь {имя: {"age", "social", "severity"}}.
+
+AGE_GROUP_UNKNOWN = "Неизвестно"
+DIMENSIONS = ("age", "social", "severity")
+
+def _severity_keys(category: str) -> list[str]:
+    return [f"{category}/всего", f"{category}/в т.ч. госпитализировано"]
+
+def _with_extra(order: list[str], extra: list[str]) -> list[str]:
+    """Категории в порядке отчета; те, что могут появиться, но не выводятся в отчет, - в конце"""
+    return order + [key for key in dict.fromkeys(extra) if key not in order]
+
+CATEGORIES = {
+    "age": config.AGE_GROUP_NAME + [AGE_GROUP_UNKNOWN],
+    "social": _with_extra(config.SOCIAL_GROUP_ORDER, list(config.SOCIAL_GROUPS)
+                          + list(config.KEYWORD_MAPPING.values()) + [config.SOCIAL_GROUP_DEFAULT]),
+    "severity": _with_extra(config.SEVERITY_ORDER, [key for category in [*config.SEVERITY_CATEGORIES, config.SEVERITY_DEFAULT]
+                                                   for key in _severity_keys(category)]),
+}
+CATEGORY_INDEX = {dim: {key: i for i, key in enumerate(keys)} for dim, keys in CATEGORIES.items()}
+WIDTH = max(len(keys) for keys in CATEGORIES.values())
+
+def _row_key(label):
+    # NaN в названии региона (пустая территория) не равен сам себе - все пустые значения в одну строку
+    return None if not isinstance(label, str) and pd.isna(label) else label
+
+def _category_codes(values: pd.Series, dimension: str) -> np.ndarray:
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    index = CATEGORY_INDEX[dimension]
+    unknown = [u for u in uniques if u not in index]
+    if unknown:
+        raise ValueError(f"Неизвестные категории раздела {dimension}: {unknown}")
+    return np.array([index[u] for u in uniques], dtype=np.int64)[codes]
+
+def _severity_codes(values: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Номера категорий "<тяжесть>/всего" и "<тяжесть>/в т.ч. госпитализировано" для каждой строки;
+    ключи строятся только для уникальных значений тяжести"""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    index = CATEGORY_INDEX["severity"]
+    pairs = [_severity_keys(u) for u in uniques]
+    unknown = [key for keys in pairs for key in keys if key not in index]
+    if unknown:
+        raise ValueError(f"Неизвестные категории раздела severity: {unknown}")
+    total = np.array([index[keys[0]] for keys in pairs], dtype=np.int64)
+    hospitalized = np.array([index[keys[1]] for keys in pairs], dtype=np.int64)
+    return total[codes], hospitalized[codes]
+
+class CountTensor(Mapping):
+    def __init__(self, labels: list | None = None, data: np.ndarray | None = None):
+        self.labels = list(labels or [])
+        self.rows = {_row_key(label): i for i, label in enumerate(self.labels)}
+        if data is None:
+            data = np.zeros((len(self.labels), len(DIMENSIONS), WIDTH), dtype=np.int64)
+        self.data = data
+
+    # --- Построение ---
+    @classmethod
+    def from_classified(cls, classified: pd.DataFrame, key: str) -> "CountTensor":
+        """Счетчики по значениям столбца key из результата classify_frame"""
+        codes, labels = pd.factorize(classified[key], use_na_sentinel=False)
+        tensor = cls(list(labels))
+        size = len(labels) * WIDTH
+        for d, column in ((0, "age_group"), (1, "social_group")):
+            flat = codes * WIDTH + _category_codes(classified[column], "age" if d == 0 else "social")
+            tensor.data[:, d, :] = np.bincount(flat, minlength=size).reshape(-1, WIDTH)
+        severity, hospitalized = _severity_codes(classified["severity"])
+        tensor.data[:, 2, :] = (np.bincount(codes * WIDTH + severity, minlength=size)
+                                + np.bincount(codes * WIDTH + hospitalized, minlength=size,
+                                              weights=classified["hospitalized"].to_numpy(dtype=np.int64))
+                                .astype(np.int64)).reshape(-1, WIDTH)
+        return tensor
+
+    @classmethod
+    def from_structures(cls, structures: Mapping) -> "CountTensor":
+        """Из словаря {имя: {"age", "social", "severity"}} (старый формат результата)"""
+        if isinstance(structures, CountTensor):
+            return structures
+        tensor = cls()
+        for name, block in structures.items():
+            row = tensor._row(name)
+            for dimension, counts in block.items():
+                for category, count in counts.items():
+                    tensor.add(name, dimension, category, count, row=row)
+        return tensor
+
+    def _row(self, label) -> int:
+        key = _row_key(label)
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.labels)
+            self.labels.append(label)
+            self.data = np.concatenate([self.data, np.zeros((1, len(DIMENSIONS), WIDTH), dtype=np.int64)])
+        return row
+
+    def add(self, label, dimension: str, category: str, count: int = 1, row: int | None = None):
+        index = CATEGORY_INDEX[dimension].get(category)
+        if index is None:
+            raise ValueError(f"Неизвестная категория раздела {dimension}: {category}")
+        row = self._row(label) if row is None else row
+        self.data[row, DIMENSIONS.index(dimension), index] += count
+
+    # --- Сложение (куски, процессы, недели) ---
+    def copy(self) -> "CountTensor":
+        return CountTensor(self.labels, self.data.copy())
+
+    def __iadd__(self, other: Mapping) -> "CountTensor":
+        other = CountTensor.from_structures(other)
+        if other.labels == self.labels:
+            self.data += other.data
+        elif other.labels:
+            rows = np.array([self._row(label) for label in other.labels])
+            self.data[rows] += other.data
+        return self
+
+    def __add__(self, other: Mapping) -> "CountTensor":
+        result = self.copy()
+        result += other
+        return result
+
+    # --- Итоги и строки отчета ---
+    def totals(self, dimension: str, keys: list[str] | None = None) -> np.ndarray:
+        """Сумма по разделу для каждой строки; keys - только перечисленные категории"""
+        values = self.data[:, DIMENSIONS.index(dimension), :]
+        if keys is not None:
+            values = values[:, [CATEGORY_INDEX[dimension][key] for key in keys]]
+        return values.sum(axis=1)
+
+    def total(self, label, dimension: str, keys: list[str] | None = None) -> int:
+        row = self.rows.get(_row_key(label))
+        return 0 if row is None else int(self.totals(dimension, keys)[row])
+
+    def to_matrix(self, labels: list, layout: dict = config.REPORT_LAYOUT, missing: int | None = 0) -> list:
+        """Строки матрицы для TemplateReport.render в порядке labels и столбцов REPORT_LAYOUT;
+        отсутствующие строки - нулями (missing=0) или None, чтобы оставить значения шаблона"""
+        keys = layout_keys(layout)
+        dims = [DIMENSIONS.index(dim) for dim, _ in keys]
+        cats = [CATEGORY_INDEX[dim][key] for dim, key in keys]
+        block = self.data[:, dims, cats] if len(self.labels) else np.zeros((0, len(keys)), dtype=np.int64)
+        present = self._present()
+        matrix = []
+        for label in labels:
+            row = self.rows.get(_row_key(label))
+            if row is None or not present[row]:
+                matrix.append(None if missing is None else [missing] * len(keys))
+            else:
+                matrix.append(block[row].tolist())
+        return matrix
+
+    # --- Представление в виде словаря ---
+    def _present(self) -> np.ndarray:
+        return self.data.any(axis=(1, 2))
+
+    def block(self, row: int) -> dict:
+        age, social, severity = self.data[row]
+        return {
+            "age": {key: int(n) for key, n in zip(CATEGORIES["age"], age) if n},
+            "social": {key: int(n) for key, n in zip(CATEGORIES["social"], social) if n},
+            "severity": {key: int(n) for key, n in zip(CATEGORIES["severity"], severity)
+                         if n or key in config.SEVERITY_ORDER},
+        }
+
+    def __getitem__(self, label) -> dict:
+        """Строка словарем для старого кода; словарь собирается заново при каждом обращении,
+        поэтому итоги и строки отчета берутся из массива через totals()/total() и to_matrix()"""
+        row = self.rows.get(_row_key(label))
+        if row is None or not self.data[row].any():
+            raise KeyError(label)
+        return self.block(row)
+
+    def __iter__(self):
+        present = self._present()
+        return (label for label, row_present in zip(self.labels, present) if row_present)
+
+    def __len__(self) -> int:
+        return int(self._present().sum())
+
+    def pop(self, label, *default):
+        """Убирает строку и возвращает ее словарем (как dict.pop)"""
+        try:
+            block = self[label]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        row = self.rows[_row_key(label)]
+        self.data = np.delete(self.data, row, axis=0)
+        del self.labels[row]
+        self.rows = {_row_key(name): i for i, name in enumerate(self.labels)}
+        return block
+
+    def to_dict(self) -> dict:
+        return {label: self[label] for label in self}
+
+    def __repr__(self) -> str:
+        return f"CountTensor({len(self)} строк)"
@@ -0,0 +1,248 @@
+import argparse
+import datetime
+import json
+import sys
+import numpy as np
+import pandas as pd
+import config
+from normalization import TrigramIndex, normalize_key
+from counts import CATEGORIES
+from store import classification_fingerprint
+from timeseries import load_cases, event_dates
+from main import logger, console, classify_frame
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+# --- Куб счетчиков: территория x МО x возраст x соц. группа x тяжесть x госпитализация x дата ---
+# Каждая строка куба - число ЭИ с одним сочетанием значений. При датах по дням сочетаний
+# почти столько же, сколько записей, но это уже классифицированная таблица из нескольких
+# столбцов: срез и свертка - фильтр и groupby по ней, без чтения и классификации выгрузок.
+# district - территория пациента из выгрузки, region - строка отчета по области
+# (случаи МО из MED_ORG относятся к Благовещенску, где бы ни жил пациент).
+
+DIMENSIONS = {
+    # разрез: заголовок
+    "district": "Территория",
+    "region": "Регион отчета",
+    "med_org": "МО",
+    "age_group": "Возрастная группа",
+    "social_group": "Социальная группа",
+    "severity": "Тяжесть",
+    "hospitalized": "Госпитализирован",
+    "date": "Дата",
+}
+PERIODS = ("day", "week", "month", "year")
+COUNT = "count"
+CUBE_META_KEY = b"population_analysis.cube"
+# Увеличивать при изменении состава разрезов: кубы старого формата нужно построить заново
+CUBE_VERSION = 2
+
+def build_frame(df: pd.DataFrame, date_column: str = config.CUBE_DATE_COLUMN) -> pd.DataFrame:
+    """Таблица куба по предобработанной выгрузке: одна строка на сочетание значений, столбец count"""
+    classified = classify_frame(df)
+    cases = pd.DataFrame({
+        "district": df[config.COL_DISTRICT].astype(object),
+        "region": classified["region"],
+        "med_org": classified["med_org"],
+        "age_group": classified["age_group"],
+        "social_group": classified["social_group"],
+        "severity": classified["severity"],
+        "hospitalized": classified["hospitalized"],
+        "date": event_dates(df[date_column]),
+    })
+    frame = cases.groupby(list(DIMENSIONS), dropna=False, observed=True).size().rename(COUNT).reset_index()
+    # возраст, соц. группы и тяжесть - в порядке отчета, территории и МО - по алфавиту
+    orders = {"age_group": CATEGORIES["age"], "social_group": CATEGORIES["social"],
+              "severity": list(config.SEVERITY_CATEGORIES) + [config.SEVERITY_DEFAULT]}
+    for dimension in DIMENSIONS:
+        if dimension in ("hospitalized", "date"):
+            continue
+        present = frame[dimension].dropna().unique()
+        order = [value for value in dict.fromkeys(orders.get(dimension, [])) if value in present]
+        frame[dimension] = pd.Categorical(frame[dimension], categories=order + sorted(set(present) - set(order)))
+    return frame
+
+class CountCube:
+    def __init__(self, frame: pd.DataFrame, meta: dict | None = None):
+        self.frame = frame
+        self.meta = meta or {}
+
+    # --- Построение и хранение ---
+    @classmethod
+    def build(cls, df: pd.DataFrame, sources: list[str] | None = None,
+              date_column: str = config.CUBE_DATE_COLUMN) -> "CountCube":
+        frame = build_frame(df, date_column)
+        meta = {
+            "fingerprint": classification_fingerprint(),
+            "version": CUBE_VERSION,
+            "date_column": date_column,
+            "sources": sources or [],
+            "built": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        return cls(frame, meta)
+
+    def save(self, path: str = config.CUBE_FILE):
+        if pyarrow is None:
+            raise RuntimeError("Для сохранения куба нужен пакет pyarrow")
+        table = pyarrow.Table.from_pandas(self.frame, preserve_index=False)
+        metadata = {**(table.schema.metadata or {}), CUBE_META_KEY: json.dumps(self.meta, ensure_ascii=False).encode("utf-8")}
+        pq.write_table(table.replace_schema_metadata(metadata), path)
+        logger.info(f"Куб сохранен в {path}: {len(self.frame)} сочетаний, {self.total()} ЭИ")
+
+    @classmethod
+    def load(cls, path: str = config.CUBE_FILE) -> "CountCube":
+        """ValueError - куб построен при других настройках классификации"""
+        if pyarrow is None:
+            raise RuntimeError("Для чтения куба нужен пакет pyarrow")
+        table = pq.read_table(path)
+        meta = json.loads((table.schema.metadata or {}).get(CUBE_META_KEY, b"{}"))
+        if meta.get("fingerprint") != classification_fingerprint():
+            raise ValueError(f"Настройки классификации в config.py изменились после построения {path}; "
+                             f"пересоберите куб командой build")
+        if meta.get("version") != CUBE_VERSION:
+            raise ValueError(f"Куб {path} построен прежней версией cube.py; пересоберите его командой build")
+        return cls(table.to_pandas(), meta)
+
+    # --- Запросы ---
+    def resolve(self, dimension: str, value: str) -> str:
+        """Значение разреза из куба: точное, единственное содержащее value ("АОИБ") или ближайшее по триграммам"""
+        categories = list(self.frame[dimension].cat.categories)
+        if value in categories:
+            return value
+        key = normalize_key(value)
+        containing = [c for c in categories if key in normalize_key(c).split(" ") or key == normalize_key(c)]
+        if len(containing) == 1:
+            return containing[0]
+        if len(containing) > 1:
+            raise ValueError(f"{DIMENSIONS[dimension]}: '{value}' подходит к нескольким значениям: {containing}")
+        index = TrigramIndex(categories, {}, config.CUBE_MATCH_MIN_SCORE, config.NORMALIZATION_MIN_MARGIN)
+        match, score = index.match(value)
+        if match is None:
+            raise ValueError(f"{DIMENSIONS[dimension]}: значение '{value}' не найдено в кубе")
+        if normalize_key(match) != normalize_key(value):
+            logger.info(f"{DIMENSIONS[dimension]}: '{value}' -> '{match}' (оценка {score:.2f})")
+        return match
+
+    def slice(self, since: str | None = None, until: str | None = None,
+              hospitalized: bool | None = None, **filters) -> "CountCube":
+        """Срез куба: filters - разрез -> значение или список значений (district="Тында", age_group=[...]);
+        since/until - границы дат включительно"""
+        mask = pd.Series(True, index=self.frame.index)
+        for dimension, values in filters.items():
+            if values is None:
+                continue
+            if dimension not in DIMENSIONS or dimension in ("hospitalized", "date"):
+                raise ValueError(f"Неизвестный разрез: {dimension}")
+            values = [values] if isinstance(values, str) else values
+            mask &= self.frame[dimension].isin([self.resolve(dimension, value) for value in values])
+        if hospitalized is not None:
+            mask &= self.frame["hospitalized"] == hospitalized
+        if since:
+            mask &= self.frame["date"] >= pd.Timestamp(since)
+        if until:
+            mask &= self.frame["date"] <= pd.Timestamp(until)
+        return CountCube(self.frame[mask], self.meta)
+
+    def total(self) -> int:
+        return int(self.frame[COUNT].sum())
+
+    def rollup(self, by: list[str] | None = None, period: str | None = None) -> pd.DataFrame:
+        """Суммы по разрезам by (в порядке перечисления); period - дата, свернутая до day/week/month/year"""
+        by = list(by or [])
+        frame = self.frame
+        if period is not None:
+            frame = frame.assign(date=period_labels(frame["date"], period))
+            if "date" not in by:
+                by.append("date")
+        if not by:
+            return pd.DataFrame({COUNT: [self.total()]})
+        result = frame.groupby(by, dropna=False, observed=True, sort=True)[COUNT].sum().reset_index()
+        return result[result[COUNT] > 0].reset_index(drop=True)
+
+PERIOD_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+
+def _period_label(day: pd.Timestamp, period: str) -> str:
+    if period == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.strftime(PERIOD_FORMATS[period])
+
+def period_labels(dates: pd.Series, period: str) -> pd.Series:
+    """Подписи периода: день, ISO-неделя (2024-W05), месяц (2024-01), год; каждая дата форматируется один раз"""
+    if period not in PERIODS:
+        raise ValueError(f"Неизвестный период: {period}")
+    codes, uniques = pd.factorize(dates)
+    labels = np.array([_period_label(day, period) for day in uniques] + [None], dtype=object)
+    return pd.Series(labels[codes], index=dates.index)
+
+# --- Командная строка ---
+def print_rollup(result: pd.DataFrame, title: str):
+    from rich.table import Table
+
+    table = Table(title=title, title_style="bold magenta")
+    for column in result.columns:
+        table.add_column(DIMENSIONS.get(column, "Случаев"), justify="right" if column == COUNT else "left")
+    for row in result.itertuples(index=False):
+        table.add_row(*("" if pd.isna(value) else str(value) for value in row))
+    console.print(table)
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Куб счетчиков ЭИ для произвольных срезов")
+    parser.add_argument("--cube", default=config.CUBE_FILE, help="файл куба (Parquet)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="построить куб по выгрузкам")
+    build.add_argument("input_files", nargs="+", help="выгрузки Report060U (повторяющиеся ЭИ берутся из более поздней)")
+    build.add_argument("--date", choices=["submit", "onset"], default=None,
+                       help="дата куба: подача ЭИ или дата заболевания (по умолчанию CUBE_DATE_COLUMN)")
+
+    query = commands.add_parser("query", help="срез и свертка куба")
+    query.add_argument("--district", nargs="+", help="территории пациента")
+    query.add_argument("--region", nargs="+", help="регионы отчета по области (Благовещенск включает МО из MED_ORG)")
+    query.add_argument("--med-org", nargs="+", help="МО")
+    query.add_argument("--age-group", nargs="+", help="возрастные группы, например 3-6 лет")
+    query.add_argument("--social-group", nargs="+", help="социальные группы")
+    query.add_argument("--severity", nargs="+", help="тяжесть: легкая, средняя")
+    hospitalized = query.add_mutually_exclusive_group()
+    hospitalized.add_argument("--hospitalized", action="store_true", help="только госпитализированные")
+    hospitalized.add_argument("--not-hospitalized", dest="hospitalized", action="store_false", help="только без госпитализации")
+    query.set_defaults(hospitalized=None)
+    query.add_argument("--since", help="начало периода, ГГГГ-ММ-ДД")
+    query.add_argument("--until", help="конец периода, ГГГГ-ММ-ДД")
+    query.add_argument("--by", nargs="+", choices=[d for d in DIMENSIONS if d != "date"], default=[],
+                       help="разрезы, по которым выводятся суммы")
+    query.add_argument("--period", choices=PERIODS, help="суммы по дням, ISO-неделям, месяцам или годам")
+    query.add_argument("--csv", metavar="PATH", help="сохранить результат в CSV")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        date_column = {"submit": config.COL_SUBMIT_DATE, "onset": config.COL_ONSET_DATE}.get(args.date,
+                                                                                             config.CUBE_DATE_COLUMN)
+        df = load_cases(args.input_files)
+        if df is None:
+            return 1
+        CountCube.build(df, args.input_files, date_column).save(args.cube)
+        return 0
+
+    try:
+        cube = CountCube.load(args.cube)
+        selected = cube.slice(args.since, args.until, args.hospitalized, district=args.district, region=args.region,
+                              med_org=args.med_org, age_group=args.age_group, social_group=args.social_group, severity=args.severity)
+    except FileNotFoundError:
+        logger.error(f"Куб {args.cube} не найден; постройте его командой build")
+        return 1
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    result = selected.rollup(args.by, args.period)
+    print_rollup(result, f"Случаев: {selected.total()}")
+    if args.csv:
+        result.rename(columns={**DIMENSIONS, COUNT: "Случаев"}).to_csv(args.csv, index=False, encoding="utf-8-sig")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
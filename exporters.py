@@ -0,0 +1,66 @@
+import datetime
+import json
+from collections.abc import Mapping
+import pandas as pd
+import config
+
+try:
+    import pyarrow  # noqa: F401  (нужен pandas для Parquet)
+except ImportError:
+    pyarrow = None
+
+# --- Машиночитаемые выгрузки результатов (для дашбордов) ---
+# Писатель - функция (results, path, source), где results - пара (result_regions, result_med_orgs)
+# из analyze_all. Новый формат подключается добавлением в WRITERS; расширение файла - ключ словаря.
+
+RESULT_COLUMNS = ["scope", "name", "dimension", "category", "count"]
+
+def _name(label):
+    # пустая территория (NaN) в JSON/CSV/Parquet пишется как пустое значение
+    return None if not isinstance(label, str) and pd.isna(label) else label
+
+def region_blocks(result_regions: dict) -> dict:
+    """Благовещенск и остальные территории одним словарем {имя: {"age","social","severity"}}"""
+    blocks = {config.CITY_MAIN: result_regions[config.CITY_MAIN]}
+    blocks.update(result_regions["Районы"].items())
+    return blocks
+
+def results_frame(results: tuple[dict, Mapping]) -> pd.DataFrame:
+    """Длинная таблица: область (region/med_org), имя, раздел, категория, количество"""
+    result_regions, result_med_orgs = results
+    rows = [
+        (scope, _name(name), dimension, category, count)
+        for scope, blocks in (("region", region_blocks(result_regions)), ("med_org", result_med_orgs))
+        for name, block in blocks.items()
+        for dimension, counts in block.items()
+        for category, count in counts.items()
+    ]
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+def write_json(results: tuple[dict, Mapping], path: str, source: str | None = None):
+    result_regions, result_med_orgs = results
+    data = {
+        "source": source,
+        "generated": datetime.datetime.now().isoformat(timespec="seconds"),
+        "regions": {_name(name): block for name, block in region_blocks(result_regions).items()},
+        "med_orgs": {_name(name): block for name, block in result_med_orgs.items()},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def write_csv(results: tuple[dict, Mapping], path: str, source: str | None = None):
+    results_frame(results).to_csv(path, index=False, encoding="utf-8-sig")
+
+def write_parquet(results: tuple[dict, Mapping], path: str, source: str | None = None):
+    if pyarrow is None:
+        raise RuntimeError("Для выгрузки в Parquet нужен пакет pyarrow")
+    results_frame(results).to_parquet(path, index=False)
+
+WRITERS = {
+    "json": write_json,
+    "csv": write_csv,
+    "parquet": write_parquet,
+}
+
+def export_path(base: str, fmt: str) -> str:
+    return f"{base}.{fmt}"
@@ -1,31 +1,216 @@
+import time
+_START = time.perf_counter()
+
+import importlib
+import itertools
+import json
+import os
+import queue
+import sys
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 import threading
 import config
-from main import preprocess_file, analyze_population_full, analyze_by_med_org, fill_report, fill_report_by_med_org
-
-def run_analysis(input_file):
-    df = preprocess_file(input_file)
-    if df is not None:
-        result_regions = analyze_population_full(df)
-        fill_report(result_regions, config.TEMPLATE_FILE_AO, config.OUTPUT_FILE_AO)
-        result_med_orgs = analyze_by_med_org(df)
-        fill_report_by_med_org(result_med_orgs, config.TEMPLATE_FILE_BLAG, config.OUTPUT_FILE_BLAG)
-        messagebox.showinfo("Готово", "Отчёты успешно сохранены!")
+
+# --- Ленивая загрузка модулей анализа ---
+# pandas, openpyxl и rich (через main) загружаются в фоне уже после появления окна,
+# пока пользователь выбирает файл. Порядок важен: каждый замер - только новые модули.
+HEAVY_MODULES = ["numpy", "pandas", "openpyxl", "rich", "main"]
+
+startup_times = {}
+pipeline_ready = threading.Event()   # устанавливается и при ошибке загрузки, тогда задан pipeline_error
+pipeline = None
+pipeline_error = None
+
+def load_pipeline():
+    global pipeline, pipeline_error
+    try:
+        for name in HEAVY_MODULES:
+            start = time.perf_counter()
+            module = importlib.import_module(name)
+            startup_times[f"import {name}"] = time.perf_counter() - start
+        pipeline = module
+        startup_times["ready"] = time.perf_counter() - _START
+    except Exception as e:
+        # без этого рабочие потоки ждали бы pipeline_ready вечно
+        pipeline_error = f"{type(e).__name__}: {e}"
+    finally:
+        pipeline_ready.set()
+
+def startup_report() -> dict:
+    report = {name: round(seconds, 4) for name, seconds in startup_times.items()}
+    if pipeline_error is not None:
+        report["error"] = pipeline_error
+    return report
+
+# --- Очередь заданий ---
+# Рабочие потоки не трогают Tk: о ходе обработки они сообщают через events,
+# а главный цикл забирает события в poll_events и обновляет окно.
+STAGE_NAMES = {"read": "прочитано строк", "classify": "классифицировано строк", "write": "сохранено файлов"}
+
+jobs = queue.Queue()
+events = queue.Queue()
+job_ids = itertools.count()
+job_state = {}      # job_id -> {"file", "selection", "shared_outputs", "cancel", "status", "line"}
+active_files = set()
+# Отчеты с общими именами (shablon_*_itog.xlsx) получает только задание, выбранное при пустой
+# очереди; остальные пишут в файлы по имени выгрузки, а совпавшие с заданием в работе - с номером задания
+reserved_outputs = set()
+outputs_lock = threading.Lock()
+
+def reserve_outputs(job_id: int) -> tuple[str, str, str]:
+    job = job_state[job_id]
+    if job["shared_outputs"]:
+        outputs = config.OUTPUT_FILE_AO, config.OUTPUT_FILE_BLAG, config.EXPORT_FILE
+    else:
+        outputs = pipeline.output_names(job["selection"], os.path.abspath("."))[job["file"]]
+    with outputs_lock:
+        if reserved_outputs.intersection(outputs):
+            stem = os.path.splitext(os.path.basename(job["file"]))[0]
+            outputs = tuple(os.path.join(os.path.abspath("."), f"{stem}_{job_id}_{name}")
+                            for name in (config.OUTPUT_FILE_AO, config.OUTPUT_FILE_BLAG, config.EXPORT_FILE))
+        reserved_outputs.update(outputs)
+    return outputs
+
+def worker():
+    pipeline_ready.wait()
+    while True:
+        job_id = jobs.get()
+        job = job_state[job_id]
+        if job["cancel"].is_set():
+            events.put((job_id, "cancelled", None))
+            continue
+        if pipeline_error is not None:
+            events.put((job_id, "failed", f"модули анализа не загружены ({pipeline_error})"))
+            continue
+        events.put((job_id, "started", None))
+        outputs = reserve_outputs(job_id)
+        try:
+            rows = pipeline.process_file(
+                job["file"], *outputs, stream=config.GUI_STREAM, cancel=job["cancel"],
+                progress=lambda stage, done, total, job_id=job_id: events.put((job_id, "progress", (stage, done, total))),
+            )
+            if rows is None:
+                events.put((job_id, "failed", "не удалось прочитать файл"))
+            else:
+                events.put((job_id, "done", rows))
+        except pipeline.Cancelled:
+            events.put((job_id, "cancelled", None))
+        except Exception as e:
+            events.put((job_id, "failed", f"{type(e).__name__}: {e}"))
+        finally:
+            with outputs_lock:
+                reserved_outputs.difference_update(outputs)
+
+def choose_files():
+    file_paths = filedialog.askopenfilenames(filetypes=[("Excel files", "*.xlsx")])
+    selection = [os.path.abspath(p) for p in file_paths if os.path.abspath(p) not in active_files]
+    if len(selection) < len(file_paths):
+        status.config(text="Файлы, которые уже в очереди, пропущены")
+    # общие имена отчетов - только если до окончания этого задания никто другой в них не напишет
+    shared_outputs = len(selection) == 1 and config.GUI_WORKERS == 1 and not active_files
+    for file_path in selection:
+        job_id = next(job_ids)
+        active_files.add(file_path)
+        job_list.insert(tk.END, "")
+        job_state[job_id] = {"file": file_path, "selection": selection, "shared_outputs": shared_outputs,
+                             "cancel": threading.Event(),
+                             "status": "в очереди", "line": job_list.size() - 1}
+        show_job(job_id)
+        jobs.put(job_id)
+
+def cancel_jobs():
+    for job in job_state.values():
+        if job["file"] in active_files:
+            job["cancel"].set()
+    status.config(text="Отмена...")
+
+def show_job(job_id):
+    job = job_state[job_id]
+    line = job["line"]
+    job_list.delete(line)
+    job_list.insert(line, f"{os.path.basename(job['file'])} - {job['status']}")
+
+def poll_events():
+    finished = []
+    while True:
+        try:
+            job_id, kind, payload = events.get_nowait()
+        except queue.Empty:
+            break
+        job = job_state[job_id]
+        if kind == "started":
+            job["status"] = "обработка"
+            progress.config(value=0, mode="indeterminate")
+            progress.start()
+        elif kind == "progress":
+            stage, done, total = payload
+            job["status"] = f"{STAGE_NAMES[stage]}: {done}" + (f" из {total}" if total else "")
+            if total:
+                progress.stop()
+                progress.config(mode="determinate", maximum=total, value=done)
+        else:
+            job["status"] = {"done": f"готово ({payload} строк)", "cancelled": "отменено",
+                             "failed": f"ошибка: {payload}"}[kind]
+            active_files.discard(job["file"])
+            finished.append(kind)
+            progress.stop()
+            progress.config(mode="determinate", value=0)
+        show_job(job_id)
+    if finished and not active_files:
+        done = sum(1 for job in job_state.values() if job["status"].startswith("готово"))
+        status.config(text="Очередь пуста")
+        # окна сообщений показываются только из главного потока
+        if "failed" in finished:
+            messagebox.showerror("Ошибка", "Не все файлы удалось обработать, подробности в списке заданий")
+        elif done:
+            messagebox.showinfo("Готово", "Отчёты успешно сохранены!")
+    root.after(100, poll_events)
+
+# --- Запуск окна ---
+def on_window_shown():
+    startup_times["window"] = time.perf_counter() - _START
+    threading.Thread(target=load_pipeline, daemon=True).start()
+    for _ in range(config.GUI_WORKERS):
+        threading.Thread(target=worker, daemon=True).start()
+    poll_pipeline()
+    poll_events()
+
+def poll_pipeline():
+    if not pipeline_ready.is_set():
+        root.after(100, poll_pipeline)
+        return
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(startup_report(), f, ensure_ascii=False, indent=2)
+        print(json.dumps(startup_report(), ensure_ascii=False, indent=2))
+    if pipeline_error is not None:
+        status.config(text="Модули анализа не загружены", fg="red")
+        messagebox.showerror("Ошибка", f"Не удалось загрузить модули анализа:\n{pipeline_error}")
     else:
-        messagebox.showerror("Ошибка", "Не удалось обработать файл")
+        status.config(text="Модули анализа загружены")
 
-def choose_file():
-    file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
-    if file_path:
-        # Запускаем анализ в отдельном потоке, чтобы GUI не вис
-        threading.Thread(target=run_analysis, args=(file_path,), daemon=True).start()
+# python gui.py --startup-report [файл.json] - сохранить время запуска по этапам
+report_path = None
+if "--startup-report" in sys.argv:
+    i = sys.argv.index("--startup-report")
+    report_path = sys.argv[i + 1] if i + 1 < len(sys.argv) else "startup_report.json"
 
 root = tk.Tk()
 root.title("Анализ данных для отчета по пневмонии (@yudenkodanil)")
 
-tk.Label(root, text="Выберите Excel-файл для анализа:").pack(pady=10)
-tk.Button(root, text="Выбрать файл", command=choose_file).pack(pady=5)
+tk.Label(root, text="Выберите Excel-файлы для анализа:").pack(pady=10)
+buttons = tk.Frame(root)
+buttons.pack(pady=5)
+tk.Button(buttons, text="Выбрать файлы", command=choose_files).pack(side=tk.LEFT, padx=5)
+tk.Button(buttons, text="Отменить", command=cancel_jobs).pack(side=tk.LEFT, padx=5)
+job_list = tk.Listbox(root, height=6)
+job_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+progress = ttk.Progressbar(root, mode="determinate")
+progress.pack(fill=tk.X, padx=10, pady=5)
+status = tk.Label(root, text="Загрузка модулей анализа...", fg="gray")
+status.pack(pady=5)
 
-root.geometry("500x200")
+root.geometry("500x320")
+root.after_idle(on_window_shown)
 root.mainloop()
@@ -0,0 +1,148 @@
+import logging
+import multiprocessing
+import queue
+import time
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+import config
+
+logger = logging.getLogger("population_analysis")
+
+# --- Список случаев с результатами классификации ---
+# Книга пишется в режиме openpyxl write_only: строки сразу уходят во временный файл,
+# поэтому память не растет с размером выгрузки. Куски передаются процессу записи через
+# очередь на LINE_LIST_PENDING_CHUNKS кусков, и запись идет одновременно с анализом.
+
+LINE_LIST_SHEET = "Случаи"
+LINE_LIST_BATCH_ROWS = 10000
+_ABORT = "abort"
+LINE_LIST_COLUMNS = {
+    # заголовок: ширина столбца
+    "Номер ЭИ": 12,
+    "Дата подачи ЭИ": 14,
+    "Территория": 30,
+    "Регион отчета": 30,
+    "МО": 45,
+    "Возрастная группа": 18,
+    "Социальная группа": 30,
+    "Тяжесть": 24,
+    "Госпитализирован": 17,
+}
+
+def _cell_values(values: pd.Series) -> pd.Series:
+    """Значения для ячеек: даты без времени, пропуски - пустые ячейки"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        values = values.dt.date
+    values = values.astype(object)
+    return values.where(values.notna(), None)
+
+def line_list_frame(df: pd.DataFrame, classified: pd.DataFrame) -> pd.DataFrame:
+    """Строки списка случаев для предобработанной таблицы и результата classify_frame"""
+    columns = [
+        df[config.COL_CASE_ID],
+        df[config.COL_SUBMIT_DATE],
+        df[config.COL_DISTRICT],     # территория пациента
+        classified["region"],        # строка отчета по области: МО из MED_ORG относятся к Благовещенску
+        df[config.COL_MED_ORG],
+        classified["age_group"],
+        classified["social_group"],
+        classified["severity"],
+        classified["hospitalized"].map({True: "да", False: "нет"}),
+    ]
+    return pd.DataFrame({name: _cell_values(values) for name, values in zip(LINE_LIST_COLUMNS, columns)})
+
+def _new_sheet():
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(LINE_LIST_SHEET)
+    # в режиме write_only оформление листа задается до первой строки
+    ws.freeze_panes = "A2"
+    for column, width in enumerate(LINE_LIST_COLUMNS.values(), start=1):
+        ws.column_dimensions[get_column_letter(column)].width = width
+    header = []
+    for name in LINE_LIST_COLUMNS:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    ws.append(header)
+    return wb, ws
+
+def _write_frame(ws, frame: pd.DataFrame):
+    # столбцы переводятся в списки частями, чтобы большой кусок не копировался целиком
+    for start in range(0, len(frame), LINE_LIST_BATCH_ROWS):
+        batch = frame.iloc[start:start + LINE_LIST_BATCH_ROWS]
+        for row in zip(*(batch[column].tolist() for column in batch.columns)):
+            ws.append(row)
+
+def _write_process(path: str, frames, results):
+    """Процесс записи: куски из очереди frames до None (сохранить) или _ABORT (выйти без сохранения)"""
+    wb, ws = _new_sheet()
+    rows, error = 0, None
+    while (frame := frames.get()) is not None:
+        if isinstance(frame, str) and frame == _ABORT:
+            return
+        if error is not None:
+            continue  # после ошибки очередь только опустошается, чтобы append не завис
+        try:
+            _write_frame(ws, frame)
+            rows += len(frame)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    if error is None:
+        try:
+            wb.save(path)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    results.put((rows, error))
+
+class LineListWriter:
+    """Пишет список случаев в отдельном процессе: запись в openpyxl - чистый Python,
+    и в потоке она отнимала бы GIL у чтения выгрузки и заполнения отчетов"""
+
+    def __init__(self, path: str = config.LINE_LIST_FILE, max_pending: int = config.LINE_LIST_PENDING_CHUNKS):
+        self.path = path
+        self.started = time.perf_counter()
+        context = multiprocessing.get_context()
+        self.frames = context.Queue(max_pending)
+        self.results = context.Queue()
+        self.process = context.Process(target=_write_process, args=(path, self.frames, self.results),
+                                       name="line-list", daemon=True)
+        self.process.start()
+
+    def _put(self, item):
+        while True:
+            try:
+                self.frames.put(item, timeout=1)
+                return
+            except queue.Full:
+                if not self.process.is_alive():
+                    raise RuntimeError("Процесс записи списка случаев неожиданно завершился")
+
+    def append(self, frame: pd.DataFrame):
+        """Добавляет строки line_list_frame; ждет, если запись отстала на max_pending кусков"""
+        self._put(frame)
+
+    def close(self) -> int:
+        """Дожидается записи всех кусков и сохраняет книгу; возвращает число строк"""
+        self._put(None)
+        while True:
+            try:
+                rows, error = self.results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError("Процесс записи списка случаев неожиданно завершился")
+        self.process.join()
+        if error is not None:
+            raise RuntimeError(f"Не удалось сохранить список случаев {self.path}: {error}")
+        logger.info(f"Список случаев ({rows} строк) сохранен в {self.path} "
+                    f"за {time.perf_counter() - self.started:.2f} с")
+        return rows
+
+    def abort(self):
+        """Останавливает запись без сохранения (обработка прервана или завершилась ошибкой)"""
+        if self.process.is_alive():
+            self._put(_ABORT)
+            self.process.join()
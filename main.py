@@ -1,12 +1,27 @@
 import pandas as pd
 import config
+import cache
+from classifiers import get_classifier, set_call_hook
+import profiling
+from report_writer import get_template, block_row
+from counts import CountTensor, AGE_GROUP_UNKNOWN
+import exporters
+import linelist
+import normalization
 import logging
 from rich.console import Console
 from rich.table import Table
 from rich.logging import RichHandler
+from pandas.tseries.api import guess_datetime_format
 from openpyxl import load_workbook
-from collections import defaultdict
 import sys
+import argparse
+import cProfile
+import time
+import threading
+import math
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import os
 
 # --- Настройка логирования ---
@@ -26,6 +41,8 @@ def resource_path(relative_path: str) -> str:
     return os.path.join(os.path.abspath("."), relative_path)
 
 # --- Утилиты ---
+COL_AGE = "Возраст"
+
 def increment_count(d: dict, key: str, val: int = 1):
     d[key] = d.get(key, 0) + val
 
@@ -36,223 +53,642 @@ def get_age_group(age: float) -> str:
                 return label
         elif low <= age < high:
             return label
-    return "Неизвестно"
+    return AGE_GROUP_UNKNOWN
 
 def classify_status(status: str, age: float | None = None) -> str:
-    status = str(status).strip().lower()
-    for group_name, keywords in config.SOCIAL_GROUPS.items():
-        if status in [kw.lower() for kw in keywords]:
-            if group_name in config.SOCIAL_GROUPS_ADULT_OVERRIDE and age is not None and age >= 18:
-                return config.SOCIAL_GROUP_DEFAULT
-            return group_name
-    for keyword, group in config.KEYWORD_MAPPING.items():
-        if keyword.lower() in status:
-            if group in config.SOCIAL_GROUPS_ADULT_OVERRIDE and age is not None and age >= 18:
-                return config.SOCIAL_GROUP_DEFAULT
-            return group
-    return config.SOCIAL_GROUP_DEFAULT
+    classifier = get_classifier()
+    group = classifier.status_group(status)
+    if group in classifier.adult_override and age is not None and age >= 18:
+        return config.SOCIAL_GROUP_DEFAULT
+    return group
 
 def classify_med_org(mo_name: str) -> str:
-    if not isinstance(mo_name, str):
-        return "Другие МО"
-    name = mo_name.lower()
-    for org, keywords in config.MED_ORGS.items():
-        for kw in keywords:
-            if kw in name:
-                return org
-    return "Другие МО"
+    return get_classifier().med_org(mo_name)
 
 def get_severity(place: str, hosp_date) -> dict:
     severity = {key: 0 for key in config.SEVERITY_ORDER}
-    place = str(place).strip()
-    category = None
-    for cat, places in config.SEVERITY_CATEGORIES.items():
-        if place in places:
-            category = cat
-            break
-    if category is None:
-        category = config.SEVERITY_DEFAULT
+    category = get_classifier().severity(place)
     severity[f"{category}/всего"] = 1
     if pd.notna(hosp_date):
         severity[f"{category}/в т.ч. госпитализировано"] = 1
     return severity
 
 # --- Предобработка файла ---
-def preprocess_file(input_file: str) -> pd.DataFrame | None:
-    input_file = resource_path(input_file)
-    try:
-        df = pd.read_excel(input_file, header=None, skiprows=3, usecols=range(39))
-        logger.info(f"Прочитано строк: {len(df)}, столбцов: {len(df.columns)}")
+INPUT_COLUMNS = 39
+INPUT_SKIP_ROWS = 3
 
-        if config.COLUMN_NAMES:
-            df.columns = config.COLUMN_NAMES[:len(df.columns)]
-        else:
-            df.columns = [f"col_{i}" for i in range(1, len(df.columns) + 1)]
+def _detect_date_format(values: pd.Series) -> str | None:
+    """Формат, который pandas выбрал бы для всего столбца: по первому непустому значению"""
+    non_null = values.dropna()
+    if non_null.empty:
+        return None
+    first = non_null.iloc[0]
+    if isinstance(first, str):
+        return guess_datetime_format(first) or "mixed"
+    return "mixed"
+
+def _parse_dates(values: pd.Series, date_formats: dict | None) -> pd.Series:
+    if date_formats is None:
+        return pd.to_datetime(values, errors='coerce')
+    fmt = date_formats.get(values.name) or _detect_date_format(values)
+    if fmt is not None:
+        date_formats[values.name] = fmt
+    return pd.to_datetime(values, format=fmt, errors='coerce')
+
+def detect_fixed_date_format(values: pd.Series) -> str | None:
+    """Формат из config.DATE_FORMATS для дат, записанных текстом; None - текстовых дат нет"""
+    strings = pd.Series(values[values.map(type) == str].unique(), dtype=object).str.strip()
+    if strings.empty:
+        return None
+    best, best_parsed = None, -1
+    for fmt in config.DATE_FORMATS:
+        parsed = pd.to_datetime(strings, format=fmt, errors='coerce').notna().sum()
+        if parsed == len(strings):
+            return fmt
+        if parsed > best_parsed:
+            best, best_parsed = fmt, parsed
+    logger.warning(f"Столбец {values.name}: {len(strings) - best_parsed} значений не подходят ни к одному формату дат, "
+                   f"используется {best}")
+    return best
+
+def compact_columns() -> list[int]:
+    """Номера столбцов выгрузки (с 0), которые читаются в компактном режиме"""
+    return [i for i, name in enumerate(config.COLUMN_NAMES) if name in config.COMPACT_COLUMNS]
+
+def _clean_frame(df: pd.DataFrame, date_formats: dict | None = None, compact: bool = False,
+                 normalize: bool = True) -> pd.DataFrame:
+    """date_formats запоминает формат дат между кусками, чтобы все куски разбирались одинаково.
+    compact - таблица прочитана только по compact_columns(): даты разбираются по фиксированному формату,
+    строковые столбцы становятся категориальными. normalize=False - без нормализации названий
+    (для кэша: ее результат зависит от выученных соответствий, см. normalize_names)"""
+    if compact:
+        df.columns = [config.COLUMN_NAMES[i] for i in compact_columns()]
+    elif config.COLUMN_NAMES:
+        df.columns = config.COLUMN_NAMES[:len(df.columns)]
+    else:
+        df.columns = [f"col_{i}" for i in range(1, len(df.columns) + 1)]
 
-        df = df.loc[:, df.columns.notna()]
+    df = df.loc[:, df.columns.notna()]
 
-        if config.COL_SOCIAL_STATUS in df.columns:
-            idx_status = df.columns.get_loc(config.COL_SOCIAL_STATUS)
-            df.iloc[:, idx_status] = df.iloc[:, idx_status].fillna(df.iloc[:, idx_status-1])
+    if config.COL_SOCIAL_STATUS in df.columns and config.COL_WORKPLACE in df.columns:
+        df[config.COL_SOCIAL_STATUS] = df[config.COL_SOCIAL_STATUS].fillna(df[config.COL_WORKPLACE])
+    if compact:
+        df = df.drop(columns=config.COL_WORKPLACE)
 
-        df[config.COL_BIRTH_DATE] = pd.to_datetime(df[config.COL_BIRTH_DATE], errors='coerce')
-        df[config.COL_SUBMIT_DATE] = pd.to_datetime(df[config.COL_SUBMIT_DATE], errors='coerce')
-        df['Возраст'] = (df[config.COL_SUBMIT_DATE] - df[config.COL_BIRTH_DATE]).dt.days / 365.25
+    with profiling.stage("Преобразование дат", rows=len(df)):
+        if compact and date_formats is None:
+            date_formats = {col: detect_fixed_date_format(df[col])
+                            for col in (config.COL_BIRTH_DATE, config.COL_SUBMIT_DATE)}
+        df[config.COL_BIRTH_DATE] = _parse_dates(df[config.COL_BIRTH_DATE], date_formats)
+        df[config.COL_SUBMIT_DATE] = _parse_dates(df[config.COL_SUBMIT_DATE], date_formats)
+        df[COL_AGE] = (df[config.COL_SUBMIT_DATE] - df[config.COL_BIRTH_DATE]).dt.days / 365.25
 
-        normalization = {
-            "Сковородино": "Сковородинский район",
-        }
-        if config.COL_DISTRICT in df.columns:
-            df[config.COL_DISTRICT] = df[config.COL_DISTRICT].replace(normalization)
+    if normalize:
+        df = normalize_names(df)
+    if compact:
+        for col in config.CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype("category")
+    return df
 
-        df.to_excel(resource_path("df_filtred.xlsx"), sheet_name="main", index=False)
-        logger.info("Файл успешно предобработан")
-        return df
+def normalize_names(df: pd.DataFrame) -> pd.DataFrame:
+    """Нормализация территорий и МО; категориальные столбцы остаются категориальными"""
+    categorical = [col for col in normalization.COLUMNS.values()
+                   if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype)]
+    with profiling.stage("Нормализация названий", rows=len(df)):
+        df = normalization.normalize_frame(df)
+    for col in categorical:
+        df[col] = df[col].astype("category")
+    return df
+
+def frame_memory_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+def _load_cached(key: str) -> pd.DataFrame | None:
+    try:
+        return cache.load(key)
+    except OSError as e:
+        logger.warning(f"Кэш недоступен, выгрузка будет прочитана заново: {e}")
+        return None
+
+def _store_cached(key: str, df: pd.DataFrame):
+    with profiling.stage("Сохранение в кэш", rows=len(df)):
+        try:
+            cache.store(key, df)
+        except OSError as e:
+            logger.warning(f"Не удалось обновить кэш: {e}")
+
+def _read_export(input_file: str, compact: bool) -> pd.DataFrame:
+    start = time.perf_counter()
+    usecols = compact_columns() if compact else range(INPUT_COLUMNS)
+    with profiling.stage("Чтение Excel") as info:
+        df = pd.read_excel(input_file, header=None, skiprows=INPUT_SKIP_ROWS, usecols=usecols)
+        info["rows"] = len(df)
+    logger.info(f"Прочитано строк: {len(df)}, столбцов: {len(df.columns)}")
+    df = _clean_frame(df, compact=compact, normalize=False)
+    logger.info(f"{'Компактная з' if compact else 'З'}агрузка: {time.perf_counter() - start:.2f} с, "
+                f"таблица в памяти: {frame_memory_mb(df):.1f} МБ")
+    return df
+
+def preprocess_file(input_file: str, use_cache: bool = config.CACHE_ENABLED,
+                    compact: bool = config.COMPACT_INGEST) -> pd.DataFrame | None:
+    input_file = resource_path(input_file)
+    # FileNotFoundError здесь - только об отсутствии выгрузки: ошибки кэша перехватываются
+    # в _load_cached/_store_cached и не выдаются за отсутствие входного файла
+    try:
+        key = cache.cache_key(input_file, compact) if use_cache and cache.is_available() else None
+        with profiling.stage("Загрузка из кэша") as info:
+            df = _load_cached(key) if key else None
+            info["rows"] = None if df is None else len(df)
+        cached = df is not None
+        if not cached:
+            df = _read_export(input_file, compact)
     except FileNotFoundError:
         logger.error(f"Файл {input_file} не найден.")
         return None
+    if cached:
+        logger.info(f"Предобработанная таблица загружена из кэша: {len(df)} строк")
+    elif key:
+        _store_cached(key, df)
+    # нормализация - после кэша: в кэше исходные названия, поэтому сброс или правка
+    # normalization.json действуют сразу, а предупреждение о чужих территориях выводится всегда
+    df = normalize_names(df)
+    logger.info("Файл успешно предобработан")
+    return df
+
+# --- Отладочная выгрузка предобработанной таблицы (по запросу, в фоне) ---
+DEBUG_DUMP_WRITERS = {
+    "csv": lambda df, path: df.to_csv(path, index=False, encoding="utf-8-sig"),
+    "parquet": lambda df, path: cache.storable_frame(df).to_parquet(path, index=False),
+    "xlsx": lambda df, path: df.to_excel(path, sheet_name="main", index=False),
+}
+
+def _write_debug_dump(df: pd.DataFrame, fmt: str, path: str) -> float:
+    start = time.perf_counter()
+    DEBUG_DUMP_WRITERS[fmt](df, path)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Отладочная таблица сохранена в {path} за {elapsed:.2f} с")
+    return elapsed
+
+def start_debug_dump(df: pd.DataFrame, fmt: str) -> Future:
+    """Пишет предобработанную таблицу в фоновом потоке; анализ и заполнение отчетов идут параллельно"""
+    path = resource_path(f"{config.DEBUG_DUMP_FILE}.{fmt}")
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="debug-dump")
+    future = executor.submit(_write_debug_dump, df, fmt, path)
+    executor.shutdown(wait=False)
+    return future
+
+# --- Потоковое чтение ---
+def _next_rows(rows, chunk_size: int) -> list[tuple]:
+    """Следующие chunk_size непустых строк, дополненные до INPUT_COLUMNS значений"""
+    buffer = []
+    for row in rows:
+        if all(value is None for value in row):
+            continue
+        buffer.append(row + (None,) * (INPUT_COLUMNS - len(row)))
+        if len(buffer) >= chunk_size:
+            break
+    return buffer
+
+def iter_preprocessed_chunks(input_file: str, chunk_size: int = config.STREAM_CHUNK_ROWS):
+    """Читает выгрузку через openpyxl read-only и отдает предобработанные куски по chunk_size строк"""
+    wb = load_workbook(resource_path(input_file), read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(min_row=INPUT_SKIP_ROWS + 1, max_col=INPUT_COLUMNS, values_only=True)
+        date_formats = {}
+        while True:
+            with profiling.stage("Чтение Excel") as info:
+                buffer = _next_rows(rows, chunk_size)
+                info["rows"] = len(buffer)
+            if not buffer:
+                break
+            yield _clean_frame(pd.DataFrame(buffer, columns=range(INPUT_COLUMNS)), date_formats)
+    finally:
+        wb.close()
 
 # --- Создание структуры региона ---
 def new_region_structure():
     return {"age": {}, "social": {}, "severity": {}}
 
+# --- Векторная классификация записей ---
+def age_group_column(age: pd.Series) -> pd.Series:
+    bins = [low for low, _ in config.AGE_GROUP] + [float("inf")]
+    groups = pd.cut(age, bins=bins, right=False, labels=config.AGE_GROUP_NAME)
+    return groups.astype(object).where(groups.notna(), AGE_GROUP_UNKNOWN)
+
+def classify_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Классифицирует все записи столбцами: регион, МО, возрастная и социальная группа, тяжесть"""
+    classifier = get_classifier()
+    with profiling.stage("Классификация", rows=len(df)):
+        is_blg = (df[config.COL_DISTRICT] == config.CITY_MAIN) | df[config.COL_MED_ORG].isin(config.MED_ORG)
+        return pd.DataFrame({
+            "region": df[config.COL_DISTRICT].astype(object).where(~is_blg, config.CITY_MAIN),
+            "med_org": classifier.med_orgs(df[config.COL_MED_ORG]),
+            "in_city_report": (df[config.COL_DISTRICT] == config.CITY_MAIN) | classifier.city_med_org_mask(df[config.COL_MED_ORG]),
+            "age_group": age_group_column(df[COL_AGE]),
+            "social_group": classifier.social_groups(df[config.COL_SOCIAL_STATUS], df[COL_AGE]),
+            "severity": classifier.severities(df[config.COL_HOSP_PLACE]),
+            "hospitalized": df[config.COL_HOSP_DATE].notna(),
+        }, index=df.index)
+
+def count_structures(classified: pd.DataFrame, key: str) -> CountTensor:
+    """Сводит классифицированные записи в счетчики {"age","social","severity"} по значениям столбца key"""
+    with profiling.stage("Агрегация", rows=len(classified)):
+        return CountTensor.from_classified(classified, key)
+
 # --- Основной анализ ---
-def analyze_population_full(df: pd.DataFrame) -> dict:
-    result = {
-        config.CITY_MAIN: new_region_structure(),
-        "Районы": {}
+def region_result(structures: dict) -> dict:
+    return {
+        config.CITY_MAIN: structures.pop(config.CITY_MAIN, new_region_structure()),
+        "Районы": structures
     }
-    mask_blg = (df[config.COL_DISTRICT] == config.CITY_MAIN) | \
-               (df[config.COL_MED_ORG].isin(config.MED_ORG))
-
-    for idx, row in df.iterrows():
-        is_blg = mask_blg[idx]
-        district = row[config.COL_DISTRICT] if not is_blg else config.CITY_MAIN
-        age_group_label = get_age_group(row['Возраст'])
-        social_group = classify_status(row.get(config.COL_SOCIAL_STATUS, ""), row['Возраст'])
-        severity_counts = get_severity(row.get(config.COL_HOSP_PLACE, ""), row.get(config.COL_HOSP_DATE, pd.NaT))
-        target_dict = result[config.CITY_MAIN] if is_blg else result["Районы"].setdefault(
-            district, new_region_structure()
-        )
-        increment_count(target_dict["age"], age_group_label)
-        increment_count(target_dict["social"], social_group)
-        for k, v in severity_counts.items():
-            increment_count(target_dict["severity"], k, v)
 
+def count_chunk(df: pd.DataFrame, detail: bool = False) -> tuple[CountTensor, CountTensor, pd.DataFrame | None]:
+    """Счетчики по территориям и по МО Благовещенска для таблицы или ее куска;
+    detail - также строки списка случаев (linelist.line_list_frame)"""
+    classified = classify_frame(df)
+    return (count_structures(classified, "region"),
+            count_structures(classified[classified["in_city_report"]], "med_org"),
+            linelist.line_list_frame(df, classified) if detail else None)
+
+# --- Параллельный анализ одной выгрузки ---
+# Классификация построчная, поэтому таблица режется на куски по PARALLEL_CHUNK_ROWS строк,
+# куски считаются в пуле процессов, а счетчики складываются в порядке кусков -
+# результат совпадает с подсчетом в одном процессе.
+
+def _init_parallel_worker():
+    # кусков много, их логи в консоли только мешают
+    logging.getLogger("population_analysis").setLevel(logging.WARNING)
+
+def parallel_workers(rows: int | None, workers: int | None = config.PARALLEL_WORKERS) -> int:
+    """Сколько процессов занять под таблицу из rows строк; 1 - считать в текущем процессе"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or rows is None or rows < config.PARALLEL_MIN_ROWS:
+        return 1
+    return min(workers, math.ceil(rows / config.PARALLEL_CHUNK_ROWS))
+
+def merge_counts(parts, line_list: linelist.LineListWriter | None = None) -> tuple[CountTensor, CountTensor]:
+    """Складывает счетчики кусков по порядку: порядок строк результата не зависит от того, какой процесс успел раньше.
+    Строки списка случаев передаются в line_list в том же порядке"""
+    regions, med_orgs = CountTensor(), CountTensor()
+    for chunk_regions, chunk_med_orgs, detail in parts:
+        regions += chunk_regions
+        med_orgs += chunk_med_orgs
+        if line_list is not None:
+            line_list.append(detail)
+    return regions, med_orgs
+
+def count_parallel(df: pd.DataFrame, workers: int, chunk_rows: int = config.PARALLEL_CHUNK_ROWS,
+                   line_list: linelist.LineListWriter | None = None) -> tuple[CountTensor, CountTensor]:
+    chunks = [df.iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows)]
+    with profiling.stage("Параллельный анализ", rows=len(df)):
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_parallel_worker) as executor:
+            counts = merge_counts(executor.map(count_chunk, chunks, [line_list is not None] * len(chunks)), line_list)
+    logger.info(f"Проанализировано кусков: {len(chunks)}, процессов: {workers}")
+    return counts
+
+def count_all(df: pd.DataFrame, workers: int | None = config.PARALLEL_WORKERS,
+              line_list: linelist.LineListWriter | None = None) -> tuple[CountTensor, CountTensor]:
+    """count_chunk для всей таблицы: в пуле процессов, если таблица достаточно большая"""
+    workers = parallel_workers(len(df), workers)
+    if workers > 1:
+        return count_parallel(df, workers, line_list=line_list)
+    return merge_counts([count_chunk(df, line_list is not None)], line_list)
+
+def analyze_all(df: pd.DataFrame, workers: int | None = config.PARALLEL_WORKERS,
+                line_list: linelist.LineListWriter | None = None) -> tuple[dict, dict]:
+    """Один проход классификации для отчета по области и отчета по МО Благовещенска;
+    line_list получает классифицированные строки для списка случаев"""
+    regions, result_med_orgs = count_all(df, workers, line_list)
+    result_regions = region_result(regions)
+    logger.info("Комплексный анализ завершен")
+    return result_regions, result_med_orgs
+
+def count_export_rows(input_file: str) -> int | None:
+    """Оценка числа строк выгрузки по размеру листа (без чтения данных)"""
+    wb = load_workbook(resource_path(input_file), read_only=True)
+    try:
+        max_row = wb.worksheets[0].max_row
+        return max(max_row - INPUT_SKIP_ROWS, 0) if max_row else None
+    finally:
+        wb.close()
+
+def _tracked_chunks(chunks, progress, cancel: threading.Event | None, total: int | None):
+    read = 0
+    for chunk in chunks:
+        read += len(chunk)
+        if progress:
+            progress("read", read, total)
+        check_cancel(cancel)
+        yield chunk
+
+def _chunk_counts(chunks, workers: int, detail: bool = False):
+    """(результат count_chunk, строк) по кускам в исходном порядке; при workers > 1 куски
+    считаются в пуле процессов, пока читаются следующие (в работе не больше 2 * workers кусков)"""
+    if workers <= 1:
+        for chunk in chunks:
+            yield count_chunk(chunk, detail), len(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_parallel_worker) as executor:
+        pending = deque()
+        try:
+            for chunk in chunks:
+                pending.append((executor.submit(count_chunk, chunk, detail), len(chunk)))
+                if len(pending) >= 2 * workers:
+                    future, size = pending.popleft()
+                    yield future.result(), size
+            while pending:
+                future, size = pending.popleft()
+                yield future.result(), size
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+def analyze_stream(input_file: str, chunk_size: int = config.STREAM_CHUNK_ROWS,
+                   progress=None, cancel: threading.Event | None = None,
+                   workers: int | None = config.PARALLEL_WORKERS,
+                   line_list: linelist.LineListWriter | None = None) -> tuple[dict, dict] | None:
+    """Потоковый вариант analyze_all: в памяти держится только текущий кусок выгрузки.
+    progress(stage, done, total) и cancel - как в process_file"""
+    regions, med_orgs = CountTensor(), CountTensor()
+    rows = 0
+    try:
+        total = count_export_rows(input_file) if progress or workers != 1 else None
+        chunks = _tracked_chunks(iter_preprocessed_chunks(input_file, chunk_size), progress, cancel, total)
+        for (chunk_regions, chunk_med_orgs, detail), size in _chunk_counts(chunks, parallel_workers(total, workers),
+                                                                           line_list is not None):
+            check_cancel(cancel)
+            regions += chunk_regions
+            med_orgs += chunk_med_orgs
+            if line_list is not None:
+                line_list.append(detail)
+            rows += size
+            if progress:
+                progress("classify", rows, total)
+    except FileNotFoundError:
+        logger.error(f"Файл {input_file} не найден.")
+        return None
+    logger.info(f"Потоково обработано строк: {rows}")
+    logger.info("Комплексный анализ завершен")
+    return region_result(regions), med_orgs
+
+def analyze_population_full(df: pd.DataFrame, workers: int | None = config.PARALLEL_WORKERS) -> dict:
+    if parallel_workers(len(df), workers) > 1:
+        regions = count_all(df, workers)[0]
+    else:
+        regions = count_structures(classify_frame(df), "region")
+    result = region_result(regions)
     logger.info("Комплексный анализ завершен")
     return result
 
-def analyze_by_med_org(df: pd.DataFrame):
-    results = defaultdict(lambda: {
-        "age": defaultdict(int),
-        "social": defaultdict(int),
-        "severity": defaultdict(int),
-    })
-    col_age = "Возраст"
-    col_social = config.COL_SOCIAL_STATUS
-    col_hosp_place = config.COL_HOSP_PLACE
-    col_hosp_date = config.COL_HOSP_DATE
-    col_med_org = config.COL_MED_ORG
-    city_main = config.CITY_MAIN
-
-    mask_blg = (
-        (df[config.COL_DISTRICT] == city_main) |
-        df[col_med_org].apply(lambda x: any(org.lower() in str(x).lower() for org in config.MED_ORGS.keys()))
-    )
-
-    df_blg = df[mask_blg]
-
-    for _, row in df_blg.iterrows():
-        org = classify_med_org(row[col_med_org])
-        age_group = get_age_group(row[col_age])
-        results[org]["age"][age_group] += 1
-        social_group = classify_status(row[col_social], row[col_age])
-        results[org]["social"][social_group] += 1
-        sev = get_severity(row.get(col_hosp_place, ""), row.get(col_hosp_date))
-        for key, val in sev.items():
-            results[org]["severity"][key] += val
-
-    return results
-
-# --- Вывод таблиц (без изменений) ---
-def _print_category_table(table: Table, title: str, data: dict, order: list[str], total_keys: list[str] | None = None):
-    total = sum(data[k] for k in total_keys) if total_keys else sum(data.values())
+def analyze_by_med_org(df: pd.DataFrame, workers: int | None = config.PARALLEL_WORKERS) -> dict:
+    if parallel_workers(len(df), workers) > 1:
+        return count_all(df, workers)[1]
+    classified = classify_frame(df)
+    return count_structures(classified[classified["in_city_report"]], "med_org")
+
+# --- Вывод таблиц ---
+def _print_category_table(table: Table, title: str, total: int, counts: dict, order: list[str]):
     table.add_row(f"[bold blue]{title} ({total})[/bold blue]", "")
     for key in order:
-        table.add_row(f"[green]{key}[/green]", f"[bright_yellow]{data.get(key, 0)}[/bright_yellow]")
+        table.add_row(f"[green]{key}[/green]", f"[bright_yellow]{counts.get(key, 0)}[/bright_yellow]")
 
-def _print_table(title: str, data: dict):
-    total = sum(data.get("age", {}).values())
-    table = Table(title=f"{title} ({total} ЭИ)", title_style="bold magenta")
+def _print_table(title: str, tensor: CountTensor, row: int, totals: dict):
+    data = tensor.block(row)
+    table = Table(title=f"{title} ({totals['age'][row]} ЭИ)", title_style="bold magenta")
     table.add_column("Категория", style="cyan")
     table.add_column("Количество", style="yellow")
-    _print_category_table(table, "Возрастная структура", data.get("age", {}), config.AGE_GROUP_NAME)
-    _print_category_table(table, "Социальная структура", data.get("social", {}), config.SOCIAL_GROUP_ORDER)
-    if "severity" in data:
-        _print_category_table(table, "Степень тяжести", data.get("severity", {}), config.SEVERITY_ORDER, total_keys=config.SEVERITY_TOTAL_KEYS)
+    _print_category_table(table, "Возрастная структура", totals["age"][row], data["age"], config.AGE_GROUP_NAME)
+    _print_category_table(table, "Социальная структура", totals["social"][row], data["social"], config.SOCIAL_GROUP_ORDER)
+    _print_category_table(table, "Степень тяжести", totals["severity"][row], data["severity"], config.SEVERITY_ORDER)
     console.print(table)
 
 def print_structure(structure: dict):
-    for region_name, data in structure.items():
-        if region_name == "Районы":
-            for district in config.ADM_TERR:
-                if district in data:
-                    _print_table(district, data[district])
-        else:
-            _print_table(region_name, data)
+    """Таблицы Благовещенска и территорий из ADM_TERR; итоги разделов - одним CountTensor.totals на все строки"""
+    tensor = CountTensor.from_structures({config.CITY_MAIN: structure[config.CITY_MAIN]})
+    tensor += structure["Районы"]
+    totals = {"age": tensor.totals("age"), "social": tensor.totals("social"),
+              "severity": tensor.totals("severity", config.SEVERITY_TOTAL_KEYS)}
+    _print_table(config.CITY_MAIN, tensor, tensor.rows[config.CITY_MAIN], totals)
+    for district in config.ADM_TERR:
+        row = tensor.rows.get(district)
+        if district != config.CITY_MAIN and row is not None and tensor.data[row].any():
+            _print_table(district, tensor, row, totals)
+
+def region_matrix(result: dict) -> list[list[int]]:
+    """Строки отчета по области: Благовещенск, затем остальные территории в порядке ADM_TERR"""
+    districts = [district for district in config.ADM_TERR if district != config.CITY_MAIN]
+    return [block_row(result[config.CITY_MAIN])] + CountTensor.from_structures(result["Районы"]).to_matrix(districts)
+
+def med_org_matrix(result: dict) -> list[list[int] | None]:
+    """Строки отчета по МО Благовещенска в порядке MED_ORGS; None - МО без случаев (ячейки шаблона не меняются)"""
+    return CountTensor.from_structures(result).to_matrix(list(config.MED_ORGS), missing=None)
 
 def fill_report(result: dict, template_file: str, output_file: str):
-    template_file = resource_path(template_file)
-    wb = load_workbook(template_file)
-    ws = wb.active
-    row = config.REPORT_LAYOUT["start_row"]
-    _fill_block(ws, result[config.CITY_MAIN], config.REPORT_LAYOUT, row)
-    row += 1
-    for district in config.ADM_TERR:
-        if district == config.CITY_MAIN:
-            continue
-        if district in result["Районы"]:
-            _fill_block(ws, result["Районы"][district], config.REPORT_LAYOUT, row)
-        else:
-            empty_block = {
-                "age": {k: 0 for k in config.AGE_GROUP_NAME},
-                "social": {k: 0 for k in config.SOCIAL_GROUP_ORDER},
-                "severity": {k: 0 for k in config.SEVERITY_ORDER}
-            }
-            _fill_block(ws, empty_block, config.REPORT_LAYOUT, row)
-        row += 1
-    wb.save(output_file)
+    with profiling.stage("Запись отчета по области"):
+        get_template(resource_path(template_file)).render(region_matrix(result), output_file)
     logger.info(f"Отчет по Амурской области сохранен в {output_file}")
 
-def _fill_block(ws, data_block: dict, layout: dict, row: int):
-    for age_group, col in layout["age"].items():
-        ws.cell(row=row, column=col, value=data_block["age"].get(age_group, 0))
-    for social_group, col in layout["social"].items():
-        ws.cell(row=row, column=col, value=data_block["social"].get(social_group, 0))
-    for severity, col in layout["severity"].items():
-        ws.cell(row=row, column=col, value=data_block["severity"].get(severity, 0))
-
 def fill_report_by_med_org(result: dict, template_file: str, output_file: str):
-    template_file = resource_path(template_file)
-    wb = load_workbook(template_file)
-    ws = wb.active
-    row = config.REPORT_LAYOUT["start_row"]
-    for org in config.MED_ORGS.keys():
-        if org not in result:
-            row += 1
-            continue
-        _fill_block(ws, result[org], config.REPORT_LAYOUT, row)
-        row += 1
-    wb.save(output_file)
+    with profiling.stage("Запись отчета по МО"):
+        get_template(resource_path(template_file)).render(med_org_matrix(result), output_file)
     logger.info(f"Отчет по Благовещенску сохранен в {output_file}")
 
+def write_export(results: tuple[dict, dict], fmt: str, path: str, source: str | None = None):
+    with profiling.stage(f"Выгрузка {fmt}"):
+        exporters.WRITERS[fmt](results, path, source)
+    logger.info(f"Результаты ({fmt}) сохранены в {path}")
+
+def write_outputs(results: tuple[dict, dict], output_ao: str = config.OUTPUT_FILE_AO,
+                  output_blag: str = config.OUTPUT_FILE_BLAG, export_base: str = config.EXPORT_FILE,
+                  exports: list[str] | None = None, source: str | None = None, progress=None) -> list[str]:
+    """Оба отчета Excel и выгрузки exports пишутся одновременно в пуле потоков.
+    Ошибка любой записи пробрасывается после того, как остальные закончатся; progress("write", done, total)"""
+    result_regions, result_med_orgs = results
+    exports = config.EXPORT_FORMATS if exports is None else exports
+    tasks = {
+        output_ao: (fill_report, result_regions, config.TEMPLATE_FILE_AO, output_ao),
+        output_blag: (fill_report_by_med_org, result_med_orgs, config.TEMPLATE_FILE_BLAG, output_blag),
+    }
+    for fmt in exports:
+        path = exporters.export_path(export_base, fmt)
+        tasks[path] = (write_export, results, fmt, path, source)
+    errors = []
+    with ThreadPoolExecutor(max_workers=config.OUTPUT_WORKERS or len(tasks), thread_name_prefix="output") as executor:
+        futures = {executor.submit(func, *args): path for path, (func, *args) in tasks.items()}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Не удалось сохранить {futures[future]}: {e}")
+                errors.append(e)
+            if progress:
+                progress("write", done, len(tasks))
+    if errors:
+        raise errors[0]
+    return list(tasks)
+
+# --- Обработка одной выгрузки (GUI, пакетный режим) ---
+class Cancelled(Exception):
+    """Обработка прервана через cancel"""
+
+def check_cancel(cancel: threading.Event | None):
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+
+def process_file(input_file: str, output_ao: str = config.OUTPUT_FILE_AO, output_blag: str = config.OUTPUT_FILE_BLAG,
+                 export_base: str = config.EXPORT_FILE, exports: list[str] | None = None,
+                 stream: bool = False, progress=None, cancel: threading.Event | None = None,
+                 workers: int | None = config.PARALLEL_WORKERS, line_list: str | None = None) -> int | None:
+    """Полный цикл для одной выгрузки; возвращает число строк или None, если файл не прочитан.
+
+    progress(stage, done, total) вызывается в потоке обработки: stage - "read" (прочитано строк),
+    "classify" (классифицировано строк) или "write" (сохранено отчетов и выгрузок exports).
+    Если cancel установлен, обработка прерывается исключением Cancelled до записи отчетов.
+    workers - процессов для анализа больших выгрузок (см. PARALLEL_WORKERS).
+    line_list - путь книги со списком случаев; она пишется в фоне по мере анализа.
+    """
+    writer = linelist.LineListWriter(line_list) if line_list else None
+    try:
+        if stream:
+            counted = {"rows": 0}
+
+            def track(stage, done, total):
+                counted["rows"] = done
+                if progress:
+                    progress(stage, done, total)
+
+            results = analyze_stream(input_file, progress=track, cancel=cancel, workers=workers, line_list=writer)
+            rows = counted["rows"]
+        else:
+            df = preprocess_file(input_file)
+            if df is None:
+                results = None
+            else:
+                rows = len(df)
+                if progress:
+                    progress("read", rows, rows)
+                check_cancel(cancel)
+                results = analyze_all(df, workers, writer)
+                if progress:
+                    progress("classify", rows, rows)
+        if results is None:
+            if writer is not None:
+                writer.abort()
+            return None
+        check_cancel(cancel)
+        write_outputs(results, output_ao, output_blag, export_base, exports, source=input_file, progress=progress)
+        if writer is not None:
+            writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    return rows
+
+def output_names(input_files: list[str], out_dir: str) -> dict[str, tuple[str, str, str]]:
+    """Имена отчетов и основа имени выгрузок результатов по имени файла (для нескольких файлов);
+    одинаковые имена получают суффикс"""
+    names, used = {}, set()
+    for input_file in input_files:
+        stem = os.path.splitext(os.path.basename(input_file))[0]
+        candidate, n = stem, 1
+        while candidate in used:
+            n += 1
+            candidate = f"{stem}_{n}"
+        used.add(candidate)
+        names[input_file] = (
+            os.path.join(out_dir, f"{candidate}_{config.OUTPUT_FILE_AO}"),
+            os.path.join(out_dir, f"{candidate}_{config.OUTPUT_FILE_BLAG}"),
+            os.path.join(out_dir, f"{candidate}_{config.EXPORT_FILE}"),
+        )
+    return names
+
 # --- Главная функция ---
-if __name__ == "__main__":
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Анализ заболеваемости ВП по выгрузке СНЕО")
+    parser.add_argument("input_file", nargs="?", default=config.INPUT_FILE, help="выгрузка Report060U (xlsx)")
+    parser.add_argument("--stream", action="store_true",
+                        help="потоковое чтение: память зависит от размера куска, а не файла")
+    parser.add_argument("--chunk-size", type=int, default=config.STREAM_CHUNK_ROWS,
+                        help="строк в куске при потоковом чтении")
+    parser.add_argument("--workers", type=int, default=config.PARALLEL_WORKERS,
+                        help="процессов для анализа больших выгрузок (0 - по числу ядер)")
+    parser.add_argument("--line-list", nargs="?", const=config.LINE_LIST_FILE, metavar="PATH",
+                        help=f"сохранить список случаев с классификацией (по умолчанию {config.LINE_LIST_FILE})")
+    parser.add_argument("--dump", choices=sorted(DEBUG_DUMP_WRITERS), default=config.DEBUG_DUMP_FORMAT,
+                        help="сохранить предобработанную таблицу в фоне (отладка)")
+    parser.add_argument("--export", nargs="+", choices=sorted(exporters.WRITERS), default=config.EXPORT_FORMATS,
+                        metavar="FORMAT", help="выгрузить результаты также в json/csv/parquet")
+    parser.add_argument("--export-file", default=config.EXPORT_FILE, help="имя выгрузок результатов без расширения")
+    parser.add_argument("--compact", action="store_true", default=config.COMPACT_INGEST,
+                        help="читать только нужные анализу столбцы, строковые - категориальными")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="не использовать кэш предобработанной выгрузки")
+    parser.add_argument("--profile", action="store_true",
+                        help="замеры по этапам: время, CPU, строки, строк/с, пик RSS процесса")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="пик памяти каждого этапа через tracemalloc (включает --profile; замедляет работу в разы)")
+    parser.add_argument("--profile-json", metavar="PATH", help="сохранить замеры этапов в JSON (включает --profile)")
+    parser.add_argument("--profile-pstats", metavar="PATH", help="сохранить дамп cProfile для pstats/snakeviz")
+    parser.add_argument("--profile-classifiers", type=int, nargs="?", const=20, metavar="N",
+                        help="показать N самых затратных вызовов классификаторов")
+    return parser.parse_args(argv)
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    profiler = (profiling.StageProfiler(trace_memory=args.profile_memory)
+                if args.profile or args.profile_json or args.profile_memory else None)
+    sampler = profiling.ClassifierSampler() if args.profile_classifiers else None
+    profiling.activate(profiler)
+    set_call_hook(sampler)
+    cprofile = cProfile.Profile() if args.profile_pstats else None
+    if cprofile is not None:
+        cprofile.enable()
+    try:
+        return run_pipeline(args)
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.profile_pstats)
+            logger.info(f"Дамп cProfile сохранен в {args.profile_pstats}")
+        profiling.activate(None)
+        set_call_hook(None)
+        if profiler is not None:
+            console.print(profiler.table())
+            if args.profile_json:
+                profiler.save_json(args.profile_json)
+        if sampler is not None:
+            console.print(sampler.table(args.profile_classifiers))
+
+def run_pipeline(args: argparse.Namespace) -> int:
     logger.info("Программа запущена")
-    df = preprocess_file(config.INPUT_FILE)
-    if df is not None:
-        result_regions = analyze_population_full(df)
+    dump = None
+    line_list = linelist.LineListWriter(args.line_list) if args.line_list else None
+    try:
+        if args.stream:
+            results = analyze_stream(args.input_file, args.chunk_size, workers=args.workers or None, line_list=line_list)
+        else:
+            df = preprocess_file(args.input_file, use_cache=config.CACHE_ENABLED and not args.no_cache,
+                                 compact=args.compact)
+            if df is not None and args.dump:
+                dump = start_debug_dump(df, args.dump)
+            results = analyze_all(df, args.workers or None, line_list) if df is not None else None
+        if results is None:
+            if line_list is not None:
+                line_list.abort()
+            return 1
+        result_regions, result_med_orgs = results
         print_structure(result_regions)
-        fill_report(result_regions, config.TEMPLATE_FILE_AO, config.OUTPUT_FILE_AO)
-        result_med_orgs = analyze_by_med_org(df)
-        fill_report_by_med_org(result_med_orgs, config.TEMPLATE_FILE_BLAG, config.OUTPUT_FILE_BLAG)
+        write_outputs(results, export_base=args.export_file, exports=args.export, source=args.input_file)
+        if line_list is not None:
+            line_list.close()
+    except BaseException:
+        if line_list is not None:
+            line_list.abort()
+        raise
+    if dump is not None:
+        dump.result()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
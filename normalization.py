@@ -0,0 +1,243 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+import pandas as pd
+import config
+
+logger = logging.getLogger("population_analysis")
+
+# --- Нормализация названий территорий и МО ---
+# Значение сначала ищется в словаре уже разобранных значений (файл NORMALIZATION_FILE),
+# затем по нормализованному написанию (регистр, пробелы, кавычки), и только новые
+# значения сравниваются по триграммам со справочником (ADM_TERR, MED_ORG).
+# Несопоставленное значение остается как есть и тоже запоминается.
+
+# Увеличивать при изменении алгоритма сопоставления, чтобы выученные соответствия пересчитались
+NORMALIZATION_VERSION = 1
+
+def vocabularies() -> dict[str, tuple[list[str], dict[str, str]]]:
+    """Справочник и явные синонимы для каждого нормализуемого столбца"""
+    return {
+        "district": (config.ADM_TERR, config.DISTRICT_NORMALIZATION),
+        "med_org": (config.MED_ORG, {}),
+    }
+
+COLUMNS = {"district": config.COL_DISTRICT, "med_org": config.COL_MED_ORG}
+
+_QUOTES = re.compile(r"[\"'«»“”„]")
+_SPACES = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d+")
+
+def normalize_key(text: str) -> str:
+    text = _QUOTES.sub(" ", text.lower().replace("ё", "е"))
+    return _SPACES.sub(" ", text).strip()
+
+def trigrams(key: str) -> Counter:
+    padded = f"  {key} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def fingerprint() -> str:
+    """Хэш справочников и порогов: от него зависят выученные соответствия"""
+    settings = [NORMALIZATION_VERSION, config.NORMALIZATION_ENABLED, vocabularies(),
+                config.NORMALIZATION_MIN_SCORE, config.NORMALIZATION_MIN_MARGIN]
+    return hashlib.sha256(json.dumps(settings, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+class TrigramIndex:
+    """Нечеткий поиск по справочнику: коэффициент Дайса по общим триграммам"""
+
+    def __init__(self, vocabulary: list[str], aliases: dict[str, str], min_score: float, min_margin: float):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.names = set(vocabulary)
+        self.exact = {normalize_key(name): name for name in vocabulary}
+        self.exact.update({normalize_key(alias): name for alias, name in aliases.items()})
+        self.entries = [(key, name, trigrams(key)) for key, name in self.exact.items()]
+        self.postings = defaultdict(list)
+        for i, (_, _, grams) in enumerate(self.entries):
+            for gram in grams:
+                self.postings[gram].append(i)
+
+    def match(self, value: str) -> tuple[str | None, float]:
+        """(название из справочника, оценка) или (None, лучшая оценка), если уверенного совпадения нет"""
+        key = normalize_key(value)
+        if key in self.exact:
+            return self.exact[key], 1.0
+        grams = trigrams(key)
+        shared = Counter()
+        for gram, n in grams.items():
+            for i in self.postings.get(gram, ()):
+                shared[i] += min(n, self.entries[i][2][gram])
+        size = sum(grams.values())
+        scores = {}
+        for i, common in shared.items():
+            entry_key, name, entry_grams = self.entries[i]
+            # "поликлиника №5" не должна совпасть с "поликлиника №1": числа в названии сравниваются точно
+            if _DIGITS.findall(entry_key) != _DIGITS.findall(key):
+                continue
+            score = 2 * common / (size + sum(entry_grams.values()))
+            scores[name] = max(scores.get(name, 0.0), score)
+        ranked = sorted(scores.values(), reverse=True) + [0.0, 0.0]
+        best = max(scores, key=scores.get) if scores else None
+        if best is None or ranked[0] < self.min_score or ranked[0] - ranked[1] < self.min_margin:
+            return None, ranked[0]
+        return best, ranked[0]
+
+class Normalizer:
+    def __init__(self, path: str = config.NORMALIZATION_FILE):
+        self.path = path
+        self.fingerprint = fingerprint()
+        self.lock = threading.Lock()
+        self.indexes = {
+            kind: TrigramIndex(vocabulary, aliases, config.NORMALIZATION_MIN_SCORE[kind], config.NORMALIZATION_MIN_MARGIN)
+            for kind, (vocabulary, aliases) in vocabularies().items()
+        }
+        self.learned = self._load()
+        self.dirty = False
+
+    def _load(self) -> dict[str, dict]:
+        learned = {kind: {} for kind in self.indexes}
+        data = self._read(self.path)
+        if not data:
+            return learned
+        if data.get("fingerprint") != self.fingerprint:
+            logger.info("Справочники территорий/МО изменились, выученные соответствия пересчитываются")
+            return learned
+        for kind in learned:
+            learned[kind].update(data.get(kind, {}))
+        return learned
+
+    def lookup(self, kind: str, value):
+        """Название из справочника или исходное значение, если совпадения нет"""
+        if not isinstance(value, str):
+            return value
+        entry = self.learned[kind].get(value)
+        if entry is None:
+            match, score = self.indexes[kind].match(value)
+            entry = self.learned[kind][value] = [match, round(score, 3)]
+            self.dirty = True
+            if match is not None and normalize_key(match) != normalize_key(value):
+                logger.info(f"Нечеткое совпадение: '{value}' -> '{match}' (оценка {score:.2f})")
+        return value if entry[0] is None else entry[0]
+
+    def normalize(self, kind: str, values: pd.Series) -> pd.Series:
+        """Заменяет значения столбца; каждое уникальное значение разбирается один раз"""
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        with self.lock:
+            labels = np.array([self.lookup(kind, value) for value in uniques], dtype=object)
+        return pd.Series(labels[codes], index=values.index, dtype=object)
+
+    def unmatched(self, kind: str, values: pd.Series) -> pd.Series:
+        """Число строк по каждому значению нормализованного столбца, которого нет в справочнике"""
+        counts = values.value_counts()
+        return counts[[value for value in counts.index if value not in self.indexes[kind].names]]
+
+    def save(self):
+        """Записывает выученные соответствия; параллельные процессы дополняют файл, а не затирают"""
+        with self.lock:
+            if not self.dirty:
+                return
+            merged = {kind: dict(values) for kind, values in self.learned.items()}
+            on_disk = Normalizer._read(self.path)
+            if on_disk.get("fingerprint") == self.fingerprint:
+                for kind in merged:
+                    merged[kind] = {**on_disk.get(kind, {}), **merged[kind]}
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"fingerprint": self.fingerprint, **merged}, f, ensure_ascii=False, indent=1)
+                os.replace(tmp_path, self.path)
+                self.dirty = False
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить файл нормализации {self.path}: {e}")
+
+    @staticmethod
+    def _read(path: str) -> dict:
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Файл нормализации {path} не прочитан ({e}), соответствия будут найдены заново")
+            return {}
+
+_normalizer: Normalizer | None = None
+_normalizer_lock = threading.Lock()
+
+def get_normalizer() -> Normalizer:
+    global _normalizer
+    with _normalizer_lock:
+        if _normalizer is None or _normalizer.fingerprint != fingerprint():
+            _normalizer = Normalizer()
+        return _normalizer
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Нормализует столбцы территории и МО предобработанной таблицы (на месте)"""
+    if not config.NORMALIZATION_ENABLED:
+        if config.COL_DISTRICT in df.columns:
+            df[config.COL_DISTRICT] = df[config.COL_DISTRICT].replace(config.DISTRICT_NORMALIZATION)
+        return df
+    normalizer = get_normalizer()
+    for kind, column in COLUMNS.items():
+        if column in df.columns:
+            df[column] = normalizer.normalize(kind, df[column])
+    normalizer.save()
+    if config.COL_DISTRICT in df.columns:
+        unmatched = normalizer.unmatched("district", df[config.COL_DISTRICT])
+        if len(unmatched):
+            listed = ", ".join(f"'{value}' ({n})" for value, n in unmatched.head(10).items())
+            logger.warning(f"Территории не из справочника ADM_TERR: {listed}"
+                           + (f" и еще {len(unmatched) - 10}" if len(unmatched) > 10 else ""))
+    return df
+
+# --- Отчет о сопоставлении (python normalization.py выгрузка.xlsx) ---
+def main(argv: list[str] | None = None) -> int:
+    from rich.table import Table
+    from main import console, INPUT_SKIP_ROWS
+
+    parser = argparse.ArgumentParser(description="Сопоставление территорий и МО со справочниками")
+    parser.add_argument("input_files", nargs="*", help="выгрузки, значения которых нужно разобрать")
+    parser.add_argument("--all", action="store_true", help="показать и точные совпадения, а не только нечеткие")
+    parser.add_argument("--reset", action="store_true", help="забыть выученные соответствия")
+    args = parser.parse_args(argv)
+
+    if args.reset and os.path.exists(config.NORMALIZATION_FILE):
+        os.remove(config.NORMALIZATION_FILE)
+    rows = {kind: Counter() for kind in COLUMNS}
+    positions = [config.COLUMN_NAMES.index(column) for column in COLUMNS.values()]
+    for input_file in args.input_files:
+        # исходные значения, до нормализации
+        raw = pd.read_excel(input_file, header=None, skiprows=INPUT_SKIP_ROWS, usecols=positions)
+        raw.columns = [config.COLUMN_NAMES[i] for i in sorted(positions)]
+        for kind, column in COLUMNS.items():
+            rows[kind].update(raw[column].dropna().astype(str).value_counts().to_dict())
+    normalizer = get_normalizer()
+    for kind in COLUMNS:
+        for value in rows[kind]:
+            normalizer.lookup(kind, value)
+    normalizer.save()
+
+    for kind, title in (("district", "Территории"), ("med_org", "МО")):
+        table = Table(title=f"{title}: сопоставление со справочником", title_style="bold magenta")
+        for column in ("Значение в выгрузке", "Справочник", "Оценка", "Строк"):
+            table.add_column(column, justify="right" if column in ("Оценка", "Строк") else "left")
+        # без выгрузок показываем все выученные соответствия, иначе - только значения из этих выгрузок
+        learned = normalizer.learned[kind]
+        entries = {value: learned[value] for value in rows[kind]} if args.input_files else learned
+        for value, (match, score) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if match is not None and normalize_key(match) == normalize_key(value) and not args.all:
+                continue
+            shown = f"[green]{match}[/green]" if match else "[red]не сопоставлено[/red]"
+            table.add_row(value, shown, f"{score:.2f}", str(rows[kind].get(value, "")))
+        console.print(table)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
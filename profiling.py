@@ -0,0 +1,180 @@
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from rich.table import Table
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+    class _ProcessMemoryCounters(ctypes.Structure):
+        # PROCESS_MEMORY_COUNTERS из psapi.h
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    try:
+        _GetCurrentProcess = ctypes.WinDLL("kernel32").GetCurrentProcess
+        _GetCurrentProcess.restype = wintypes.HANDLE
+        _GetProcessMemoryInfo = ctypes.WinDLL("psapi").GetProcessMemoryInfo
+        _GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(_ProcessMemoryCounters), wintypes.DWORD]
+        _GetProcessMemoryInfo.restype = wintypes.BOOL
+    except (OSError, AttributeError):
+        _GetProcessMemoryInfo = None
+else:
+    _GetProcessMemoryInfo = None
+
+# --- Замеры по этапам конвейера (main.py --profile) ---
+# Этапы размечаются через profiling.stage(...) прямо в коде main.py; пока профилировщик
+# не активирован, разметка ничего не делает и не влияет на скорость.
+# По умолчанию память - дешевый пик RSS процесса на конец этапа; tracemalloc (точный пик
+# Python-аллокаций по этапу) включается отдельно: он замедляет программу в разы, особенно
+# чтение Excel через openpyxl, и искажает время этапов.
+
+def peak_rss_mb() -> float | None:
+    """Максимальный RSS процесса с начала работы (в Windows - пиковый рабочий набор);
+    None, если узнать его нельзя"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдает килобайты, macOS - байты
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    if _GetProcessMemoryInfo is not None:
+        counters = _ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if _GetProcessMemoryInfo(_GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / (1024 * 1024)
+    return None
+
+class StageProfiler:
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.lock = threading.Lock()  # этапы записи результатов идут в нескольких потоках
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str, rows: int | None = None):
+        info = {"rows": rows}
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield info
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024) if tracemalloc.is_tracing() else None
+            self._record(name, wall, cpu, info["rows"], peak, peak_rss_mb())
+
+    def _record(self, name: str, wall: float, cpu: float, rows: int | None, peak_mb: float | None,
+                rss_mb: float | None = None):
+        # повторные вызовы этапа (например, по кускам потокового чтения) суммируются
+        with self.lock:
+            s = self.stages.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                              "rows": None, "peak_memory_mb": None, "peak_rss_mb": None})
+            s["calls"] += 1
+            s["wall_seconds"] += wall
+            s["cpu_seconds"] += cpu
+            if rows is not None:
+                s["rows"] = (s["rows"] or 0) + rows
+            if peak_mb is not None:
+                s["peak_memory_mb"] = max(s["peak_memory_mb"] or 0.0, peak_mb)
+            if rss_mb is not None:
+                s["peak_rss_mb"] = max(s["peak_rss_mb"] or 0.0, rss_mb)
+
+    def summary(self) -> dict:
+        result = {}
+        for name, s in self.stages.items():
+            rate = s["rows"] / s["wall_seconds"] if s["rows"] and s["wall_seconds"] else None
+            result[name] = {**s, "rows_per_sec": rate}
+        return result
+
+    def table(self) -> Table:
+        table = Table(title="Профиль выполнения", title_style="bold magenta")
+        columns = ["Этап", "Вызовов", "Время, с", "CPU, с", "Строк", "Строк/с", "Пик RSS, МБ"]
+        if self.trace_memory:
+            columns.append("Пик памяти этапа, МБ")
+        for column in columns:
+            table.add_column(column, justify="left" if column == "Этап" else "right")
+        total_wall = 0.0
+        for name, s in self.summary().items():
+            total_wall += s["wall_seconds"]
+            row = [
+                f"[cyan]{name}[/cyan]", str(s["calls"]), f"{s['wall_seconds']:.3f}", f"{s['cpu_seconds']:.3f}",
+                "" if s["rows"] is None else str(s["rows"]),
+                "" if s["rows_per_sec"] is None else f"{s['rows_per_sec']:.0f}",
+                "" if s["peak_rss_mb"] is None else f"{s['peak_rss_mb']:.1f}",
+            ]
+            if self.trace_memory:
+                row.append("" if s["peak_memory_mb"] is None else f"{s['peak_memory_mb']:.1f}")
+            table.add_row(*row)
+        table.caption = f"Сумма по этапам: {total_wall:.3f} с"
+        return table
+
+    def save_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+_active: StageProfiler | None = None
+
+def activate(profiler: StageProfiler | None):
+    global _active
+    if _active is not None:
+        _active.stop()
+    _active = profiler
+    if profiler is not None:
+        profiler.start()
+
+@contextmanager
+def stage(name: str, rows: int | None = None):
+    if _active is None:
+        yield {"rows": rows}
+        return
+    with _active.stage(name, rows) as info:
+        yield info
+
+# --- Выборка самых затратных вызовов классификаторов ---
+class ClassifierSampler:
+    """Подключается через classifiers.set_call_hook: время каждого вызова и число строк, на которые он разошелся"""
+
+    def __init__(self):
+        self.calls = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "rows": 0})
+
+    def __call__(self, func, value, rows: int):
+        start = time.perf_counter()
+        label = func(value)
+        entry = self.calls[(func.__name__, str(value))]
+        entry["calls"] += 1
+        entry["seconds"] += time.perf_counter() - start
+        entry["rows"] += rows
+        return label
+
+    def hottest(self, limit: int = 20) -> list[dict]:
+        items = sorted(self.calls.items(), key=lambda item: item[1]["seconds"], reverse=True)[:limit]
+        return [{"classifier": name, "value": value, **entry} for (name, value), entry in items]
+
+    def table(self, limit: int = 20) -> Table:
+        table = Table(title="Самые затратные вызовы классификаторов", title_style="bold magenta")
+        for column in ("Классификатор", "Значение", "Вызовов", "Время, мкс", "Строк"):
+            table.add_column(column, justify="left" if column in ("Классификатор", "Значение") else "right")
+        for entry in self.hottest(limit):
+            table.add_row(entry["classifier"], entry["value"][:60], str(entry["calls"]),
+                          f"{entry['seconds'] * 1e6:.1f}", str(entry["rows"]))
+        return table
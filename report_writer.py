@@ -0,0 +1,67 @@
+import os
+import threading
+from openpyxl import load_workbook
+import config
+
+# --- Заполнение шаблонов отчетов ---
+# Шаблон читается с диска один раз на процесс; значения ячеек области данных запоминаются,
+# поэтому из одной загруженной книги можно сохранить сколько угодно отчетов подряд.
+
+LAYOUT_DIMENSIONS = ("age", "social", "severity")
+
+def layout_keys(layout: dict = config.REPORT_LAYOUT) -> list[tuple[str, str]]:
+    """Пары (раздел, категория) в порядке столбцов матрицы"""
+    return [(dim, key) for dim in LAYOUT_DIMENSIONS for key in layout[dim]]
+
+def layout_columns(layout: dict = config.REPORT_LAYOUT) -> list[int]:
+    return [layout[dim][key] for dim, key in layout_keys(layout)]
+
+def block_row(data_block: dict, layout: dict = config.REPORT_LAYOUT) -> list[int]:
+    """Строка матрицы для одного региона/МО: значения в порядке столбцов REPORT_LAYOUT"""
+    return [data_block.get(dim, {}).get(key, 0) for dim, key in layout_keys(layout)]
+
+class TemplateReport:
+    def __init__(self, template_file: str, layout: dict = config.REPORT_LAYOUT):
+        self.template_file = template_file
+        self.wb = load_workbook(template_file)
+        self.ws = self.wb.active
+        self.start_row = layout["start_row"]
+        self.columns = layout_columns(layout)
+        self.lock = threading.Lock()
+        # openpyxl при сохранении запоминает max_outline столбцов и со второго сохранения
+        # дописывает outlineLevelCol в sheetFormatPr; восстанавливаем исходное значение,
+        # чтобы каждое сохранение давало такой же файл, как первое
+        self.max_outline = self.ws.column_dimensions.max_outline
+        self.original = [
+            [self.ws.cell(row=row, column=col).value for col in self.columns]
+            for row in range(self.start_row, self.ws.max_row + 1)
+        ]
+
+    def render(self, matrix: list[list[int] | None], output_file: str):
+        """Записывает строки матрицы начиная со start_row; строка None оставляет значения шаблона"""
+        with self.lock:
+            # строки за пределами запомненной области еще не менялись - запоминаем их как есть
+            while len(self.original) < len(matrix):
+                row = self.start_row + len(self.original)
+                self.original.append([self.ws.cell(row=row, column=col).value for col in self.columns])
+            for i, original in enumerate(self.original):
+                values = matrix[i] if i < len(matrix) and matrix[i] is not None else original
+                row = self.start_row + i
+                for col, value in zip(self.columns, values):
+                    self.ws.cell(row=row, column=col).value = value
+            self.ws.column_dimensions.max_outline = self.max_outline
+            self.wb.save(output_file)
+
+_templates: dict[tuple[str, float], TemplateReport] = {}
+_templates_lock = threading.Lock()
+
+def get_template(template_file: str) -> TemplateReport:
+    """Загруженный шаблон из кэша процесса; перечитывается только если файл изменился"""
+    key = (os.path.abspath(template_file), os.path.getmtime(template_file))
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            for stale in [k for k in _templates if k[0] == key[0]]:
+                del _templates[stale]
+            template = _templates[key] = TemplateReport(template_file)
+        return template
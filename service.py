@@ -0,0 +1,246 @@
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import config
+from classifiers import get_classifier
+from exporters import WRITERS
+from main import logger, resource_path, process_file
+from report_writer import get_template
+
+# --- Локальный сервис отчетов ---
+# Процесс запускается один раз: классификаторы и шаблоны отчетов остаются в памяти,
+# поэтому каждая выгрузка платит только за чтение и анализ.
+#
+#   curl --data-binary @Report060U.xlsx "http://127.0.0.1:8060/report?export=json" -o reports.zip
+#   curl http://127.0.0.1:8060/metrics
+
+class Metrics:
+    """Счетчики запросов и время обработки (по последним SERVICE_METRICS_WINDOW запросам)"""
+
+    def __init__(self, window: int = config.SERVICE_METRICS_WINDOW):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {"requests": 0, "ok": 0, "failed": 0, "rejected": 0, "timeouts": 0, "rows": 0}
+        self.in_flight = 0
+        self.timings = {"wait": deque(maxlen=window), "process": deque(maxlen=window), "total": deque(maxlen=window)}
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] += n
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            self.timings[name].append(seconds)
+
+    def track(self, delta: int):
+        with self.lock:
+            self.in_flight += delta
+
+    @staticmethod
+    def _stats(values: list[float]) -> dict:
+        if not values:
+            return {"count": 0}
+        values = sorted(values)
+        def pick(q):
+            return round(values[min(int(q * len(values)), len(values) - 1)], 4)
+        return {"count": len(values), "mean": round(sum(values) / len(values), 4),
+                "p50": pick(0.5), "p95": pick(0.95), "max": round(values[-1], 4)}
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "in_flight": self.in_flight,
+                **self.counters,
+                "seconds": {name: self._stats(list(values)) for name, values in self.timings.items()},
+            }
+
+class ReportService:
+    def __init__(self, workers: int = config.SERVICE_WORKERS, max_pending: int = config.SERVICE_MAX_PENDING):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        # очередь ограничена: лишние запросы сразу получают 503, а не копятся в памяти
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+        self.metrics = Metrics()
+
+    def warm_up(self):
+        start = time.perf_counter()
+        get_classifier()
+        get_template(resource_path(config.TEMPLATE_FILE_AO))
+        get_template(resource_path(config.TEMPLATE_FILE_BLAG))
+        logger.info(f"Классификаторы и шаблоны загружены за {time.perf_counter() - start:.2f} с")
+
+    def _run(self, data: bytes, exports: list[str], stream: bool, cancel: threading.Event, queued: float) -> tuple[bytes, int]:
+        self.metrics.observe("wait", time.perf_counter() - queued)
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix="report-") as work_dir:
+            input_file = os.path.join(work_dir, config.INPUT_FILE)
+            with open(input_file, "wb") as f:
+                f.write(data)
+            output_ao = os.path.join(work_dir, config.OUTPUT_FILE_AO)
+            output_blag = os.path.join(work_dir, config.OUTPUT_FILE_BLAG)
+            export_base = os.path.join(work_dir, config.EXPORT_FILE)
+            rows = process_file(input_file, output_ao, output_blag, export_base, exports, stream=stream, cancel=cancel)
+            if rows is None:
+                raise ValueError("не удалось прочитать выгрузку")
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for path in [output_ao, output_blag] + [f"{export_base}.{fmt}" for fmt in exports]:
+                    archive.write(path, os.path.basename(path))
+        self.metrics.observe("process", time.perf_counter() - start)
+        return buffer.getvalue(), rows
+
+    def reserve(self) -> bool:
+        """Место в очереди; False - очередь заполнена. Берется до чтения тела запроса,
+        чтобы отклоненные запросы не загружали выгрузку в память"""
+        return self.slots.acquire(blocking=False)
+
+    def release(self):
+        """Возвращает место, если до submit дело не дошло (клиент оборвал загрузку)"""
+        self.slots.release()
+
+    def submit(self, data: bytes, exports: list[str], stream: bool, timeout: float = config.SERVICE_TIMEOUT):
+        """Архив с отчетами и число строк для места, полученного reserve; место освобождается
+        по окончании обработки. TimeoutError - не уложились в timeout"""
+        cancel = threading.Event()
+        future = self.executor.submit(self._run, data, exports, stream, cancel, time.perf_counter())
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            cancel.set()  # обработка остановится на ближайшей проверке и освободит поток
+            raise
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class ReportHandler(BaseHTTPRequestHandler):
+    service: ReportService = None
+    server_version = "PopulationAnalysis/1.0"
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json; charset=utf-8", headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: dict):
+        self._send(status, json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"))
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif path == "/metrics":
+            self._send_json(200, self.service.metrics.snapshot())
+        else:
+            self._send_json(404, {"error": "неизвестный адрес"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/report":
+            self._send_json(404, {"error": "неизвестный адрес"})
+            return
+        metrics = self.service.metrics
+        metrics.count("requests")
+        query = parse_qs(url.query)
+        exports = [fmt for value in query.get("export", []) for fmt in value.split(",") if fmt]
+        unknown = [fmt for fmt in exports if fmt not in WRITERS]
+        length = int(self.headers.get("Content-Length") or 0)
+        if unknown:
+            metrics.count("failed")
+            self._send_json(400, {"error": f"неизвестные форматы выгрузки: {unknown}"})
+            return
+        if not length or length > config.SERVICE_MAX_UPLOAD_MB * 1024 * 1024:
+            metrics.count("failed")
+            self._send_json(400, {"error": f"нужна выгрузка xlsx в теле запроса (не больше {config.SERVICE_MAX_UPLOAD_MB} МБ)"})
+            return
+        if not self.service.reserve():
+            # тело не читается: соединение закрывается после ответа
+            metrics.count("rejected")
+            self._send_json(503, {"error": "очередь заполнена, повторите позже"})
+            self.close_connection = True
+            return
+        try:
+            data = self.rfile.read(length)
+        except Exception:
+            self.service.release()
+            raise
+        if len(data) < length:
+            self.service.release()
+            metrics.count("failed")
+            logger.warning(f"Загрузка выгрузки оборвалась: получено {len(data)} из {length} байт")
+            return
+        stream = query.get("stream", ["0"])[0] in ("1", "true")
+
+        start = time.perf_counter()
+        metrics.track(1)
+        try:
+            archive, rows = self.service.submit(data, exports, stream)
+        except TimeoutError:
+            metrics.count("timeouts")
+            self._send_json(504, {"error": f"обработка не уложилась в {config.SERVICE_TIMEOUT} с"})
+            return
+        except Exception as e:
+            metrics.count("failed")
+            logger.error(f"Ошибка обработки выгрузки: {type(e).__name__}: {e}")
+            self._send_json(422, {"error": f"{type(e).__name__}: {e}"})
+            return
+        finally:
+            metrics.track(-1)
+        seconds = time.perf_counter() - start
+        metrics.observe("total", seconds)
+        metrics.count("ok")
+        metrics.count("rows", rows)
+        logger.info(f"Выгрузка обработана: {rows} строк за {seconds:.2f} с")
+        self._send(200, archive, "application/zip", {
+            "Content-Disposition": 'attachment; filename="reports.zip"',
+            "X-Rows": str(rows),
+            "X-Processing-Seconds": f"{seconds:.3f}",
+        })
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+def serve(host: str = config.SERVICE_HOST, port: int = config.SERVICE_PORT, workers: int = config.SERVICE_WORKERS,
+          max_pending: int = config.SERVICE_MAX_PENDING):
+    service = ReportService(workers, max_pending)
+    service.warm_up()
+    handler = type("Handler", (ReportHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    logger.info(f"Сервис отчетов запущен: http://{host}:{server.server_address[1]} (обработчиков: {workers})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        logger.info("Сервис отчетов остановлен")
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Локальный HTTP-сервис отчетов по выгрузкам СНЕО")
+    parser.add_argument("--host", default=config.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVICE_WORKERS, help="выгрузок, обрабатываемых одновременно")
+    parser.add_argument("--max-pending", type=int, default=config.SERVICE_MAX_PENDING,
+                        help="запросов, ожидающих обработчика; остальные получают 503")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers, args.max_pending)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import pandas as pd
+import config
+import normalization
+from counts import CountTensor
+from main import (logger, preprocess_file, classify_frame, region_result,
+                  print_structure, fill_report, fill_report_by_med_org)
+
+# --- Накопительное хранилище агрегатов по "Номер ЭИ" ---
+# В records хранится классификация каждой ЭИ, в counts - готовые счетчики отчетов.
+# Новая выгрузка меняет counts только на разницу между старой и новой классификацией
+# изменившихся записей, поэтому построение отчета не перечитывает историю.
+
+RECORD_FIELDS = ["region", "med_org", "age_group", "social_group", "severity", "hospitalized"]
+# Записи без территории считаются в отдельной строке региона, как в analyze_all (ключ NaN в "Районы").
+# В counts ее имя - пустая строка: NULL в первичном ключе не дал бы складывать счетчики через ON CONFLICT
+EMPTY_REGION = ""
+# Увеличивать при изменении способа подсчета counts: при открытии они пересчитываются из records
+COUNTS_VERSION = "2"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    case_id TEXT PRIMARY KEY,
+    region TEXT,
+    med_org TEXT,
+    age_group TEXT,
+    social_group TEXT,
+    severity TEXT,
+    hospitalized INTEGER
+);
+CREATE TABLE IF NOT EXISTS counts (
+    scope TEXT,
+    name TEXT,
+    dimension TEXT,
+    category TEXT,
+    count INTEGER,
+    PRIMARY KEY (scope, name, dimension, category)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def classification_fingerprint() -> str:
+    """Хэш настроек классификации: при их изменении накопленные записи нужно пересобрать"""
+    settings = [config.CITY_MAIN, config.MED_ORG, config.MED_ORGS, config.AGE_GROUP, config.AGE_GROUP_NAME,
+                config.SOCIAL_GROUPS, config.SOCIAL_GROUPS_ADULT_OVERRIDE, config.SOCIAL_GROUP_DEFAULT,
+                config.KEYWORD_MAPPING, config.SEVERITY_CATEGORIES, config.SEVERITY_DEFAULT,
+                normalization.fingerprint()]
+    return hashlib.sha256(json.dumps(settings, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _case_id(value) -> str | None:
+    if pd.isna(value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip() or None
+
+def _contributions(records: pd.DataFrame, sign: int) -> pd.DataFrame:
+    """Счетчики, в которые попадает каждая запись: по региону и (для Благовещенска) по МО"""
+    parts = []
+    for scope, name_col in (("region", "region"), ("med_org", "med_org")):
+        if scope == "region":
+            base = records.assign(region=records["region"].fillna(EMPTY_REGION))
+        else:
+            base = records[records[name_col].notna()]
+        for dimension, category in (("age", base["age_group"]),
+                                     ("social", base["social_group"]),
+                                     ("severity", base["severity"] + "/всего")):
+            parts.append(pd.DataFrame({"scope": scope, "name": base[name_col],
+                                       "dimension": dimension, "category": category}))
+        hosp = base[base["hospitalized"].astype(bool)]
+        parts.append(pd.DataFrame({"scope": scope, "name": hosp[name_col], "dimension": "severity",
+                                   "category": hosp["severity"] + "/в т.ч. госпитализировано"}))
+    frame = pd.concat(parts, ignore_index=True)
+    frame["count"] = sign
+    return frame
+
+class AggregateStore:
+    def __init__(self, path: str = config.STORE_FILE, rebuild: bool = False):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        if rebuild:
+            self.conn.executescript("DROP TABLE IF EXISTS records; DROP TABLE IF EXISTS counts; DROP TABLE IF EXISTS meta;")
+        self.conn.executescript(SCHEMA)
+        fingerprint = classification_fingerprint()
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+            self.conn.commit()
+        elif row[0] != fingerprint:
+            self.conn.close()
+            raise ValueError(f"Настройки классификации в config.py изменились после создания {path}; "
+                             f"пересоберите хранилище с параметром --rebuild")
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'counts_version'").fetchone()
+        if row is None or row[0] != COUNTS_VERSION:
+            self._recount()
+
+    def _recount(self):
+        """Пересчитывает counts по сохраненным records (хранилище прежней версии)"""
+        records = pd.read_sql_query("SELECT * FROM records", self.conn)
+        counts = _contributions(records, 1).groupby(["scope", "name", "dimension", "category"],
+                                                    as_index=False)["count"].sum()
+        with self.conn:
+            self.conn.execute("DELETE FROM counts")
+            self.conn.executemany("INSERT INTO counts VALUES (?, ?, ?, ?, ?)",
+                                  counts.astype(object).itertuples(index=False, name=None))
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('counts_version', ?)", (COUNTS_VERSION,))
+        if len(records):
+            logger.info(f"Счетчики хранилища {self.path} пересчитаны по {len(records)} записям")
+
+    def close(self):
+        self.conn.close()
+
+    def _classify(self, df: pd.DataFrame) -> pd.DataFrame:
+        classified = classify_frame(df)
+        records = pd.DataFrame({
+            "case_id": df[config.COL_CASE_ID].map(_case_id),
+            "region": classified["region"].where(classified["region"].notna(), None),
+            "med_org": classified["med_org"].where(classified["in_city_report"], None),
+            "age_group": classified["age_group"],
+            "social_group": classified["social_group"],
+            "severity": classified["severity"],
+            "hospitalized": classified["hospitalized"].astype(int),
+        })
+        missing = records["case_id"].isna().sum()
+        if missing:
+            logger.warning(f"Пропущено записей без номера ЭИ: {missing}")
+        return records.dropna(subset=["case_id"]).drop_duplicates("case_id", keep="last")
+
+    def _existing(self, case_ids: pd.Series) -> pd.DataFrame:
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (case_id TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM incoming")
+        self.conn.executemany("INSERT INTO incoming VALUES (?)", ((c,) for c in case_ids))
+        return pd.read_sql_query(
+            "SELECT r.* FROM records r JOIN incoming i ON r.case_id = i.case_id", self.conn
+        )
+
+    def merge(self, df: pd.DataFrame) -> dict:
+        """Добавляет новые ЭИ, обновляет изменившиеся; возвращает число новых/измененных/без изменений"""
+        incoming = self._classify(df)
+        existing = self._existing(incoming["case_id"])
+        merged = incoming.merge(existing, on="case_id", how="left", suffixes=("", "_old"), indicator=True)
+        is_new = merged["_merge"] == "left_only"
+        differs = pd.Series(False, index=merged.index)
+        for field in RECORD_FIELDS:
+            new, old = merged[field], merged[f"{field}_old"]
+            differs |= ~((new == old) | (new.isna() & old.isna()))
+        changed = differs & ~is_new
+
+        old_rows = merged.loc[changed, ["case_id"] + [f"{f}_old" for f in RECORD_FIELDS]]
+        old_rows.columns = ["case_id"] + RECORD_FIELDS
+        new_rows = merged.loc[is_new | changed, ["case_id"] + RECORD_FIELDS]
+        delta = pd.concat([_contributions(old_rows, -1), _contributions(new_rows, 1)], ignore_index=True)
+        delta = delta.groupby(["scope", "name", "dimension", "category"], as_index=False)["count"].sum()
+        delta = delta[delta["count"] != 0]
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO counts VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(scope, name, dimension, category) DO UPDATE SET count = count + excluded.count",
+                delta.itertuples(index=False, name=None),
+            )
+            self.conn.execute("DELETE FROM counts WHERE count = 0")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?)",
+                new_rows.astype(object).where(new_rows.notna(), None).itertuples(index=False, name=None),
+            )
+        stats = {"new": int(is_new.sum()), "changed": int(changed.sum()),
+                 "unchanged": int(len(merged) - is_new.sum() - changed.sum())}
+        logger.info(f"Хранилище {self.path}: новых ЭИ {stats['new']}, изменено {stats['changed']}, "
+                    f"без изменений {stats['unchanged']}")
+        return stats
+
+    def structures(self) -> tuple[dict, CountTensor]:
+        """Структуры для fill_report и fill_report_by_med_org, собранные только из счетчиков"""
+        scopes = {"region": CountTensor(), "med_org": CountTensor()}
+        for scope, name, dimension, category, count in self.conn.execute(
+                "SELECT scope, name, dimension, category, count FROM counts ORDER BY rowid"):
+            if scope == "region" and name == EMPTY_REGION:
+                name = float("nan")
+            scopes[scope].add(name, dimension, category, count)
+        return region_result(scopes["region"]), scopes["med_org"]
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Накопительное хранилище агрегатов по номерам ЭИ")
+    parser.add_argument("input_files", nargs="*", help="выгрузки Report060U для добавления в хранилище")
+    parser.add_argument("--db", default=config.STORE_FILE, help="файл хранилища SQLite")
+    parser.add_argument("--rebuild", action="store_true", help="очистить хранилище перед загрузкой")
+    parser.add_argument("--no-report", action="store_true", help="только обновить хранилище")
+    args = parser.parse_args(argv)
+
+    try:
+        store = AggregateStore(args.db, rebuild=args.rebuild)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    try:
+        for input_file in args.input_files:
+            df = preprocess_file(input_file)
+            if df is None:
+                return 1
+            store.merge(df)
+        if not args.no_report:
+            result_regions, result_med_orgs = store.structures()
+            print_structure(result_regions)
+            fill_report(result_regions, config.TEMPLATE_FILE_AO, config.OUTPUT_FILE_AO)
+            fill_report_by_med_org(result_med_orgs, config.TEMPLATE_FILE_BLAG, config.OUTPUT_FILE_BLAG)
+    finally:
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import multiprocessing
+import os
+import time
+import pytest
+import batch
+
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                                reason="подмена process_export видна рабочим процессам только при fork")
+
+# --- Аварийное завершение рабочего процесса ---
+def crashing_export(input_file: str, *args) -> dict:
+    """Вместо обработки: выгрузки bad_* роняют процесс, как OOM или сбой разбора XLSX"""
+    if os.path.basename(input_file).startswith("bad_"):
+        os._exit(1)
+    time.sleep(0.1)  # остальные задания еще в очереди, когда пул ломается
+    return {"file": input_file, "rows": 1, "seconds": 0.0, "error": None}
+
+def test_crashed_worker_fails_only_its_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "process_export", crashing_export)
+    files = [str(tmp_path / f"{prefix}_{i}.xlsx") for i, prefix in enumerate(["ok"] * 3 + ["bad"] + ["ok"] * 6 + ["bad"])]
+    results = batch.run_batch(files, str(tmp_path / "out"), workers=2)
+    assert [s["file"] for s in results] == files
+    failed = [os.path.basename(s["file"]) for s in results if s["error"]]
+    assert failed == ["bad_3.xlsx", "bad_10.xlsx"]
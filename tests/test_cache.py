@@ -0,0 +1,43 @@
+import os
+import pytest
+import cache
+import config
+import main
+from benchmark import generate_export
+
+pytestmark = pytest.mark.skipif(not cache.is_available(), reason="кэш требует pyarrow")
+
+# --- Кэш при одновременной работе нескольких процессов (batch.py) ---
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / ".cache"))
+    path = str(tmp_path / "report060u.xlsx")
+    generate_export(path, 50, seed=3)
+    return path
+
+def test_evict_skips_entries_removed_by_another_process(export, monkeypatch):
+    main.preprocess_file(export, use_cache=True)
+    entries = [os.path.join(config.CACHE_DIR, name) for name in os.listdir(config.CACHE_DIR)]
+    real_stat, removed = os.stat, set()
+
+    def stat_after_removal(path, *args, **kwargs):
+        # другой процесс удалил запись между listdir и stat
+        if path in entries and path not in removed:
+            removed.add(path)
+            os.remove(path)
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(config, "CACHE_MAX_AGE_DAYS", 0)
+    monkeypatch.setattr(cache.os, "stat", stat_after_removal)
+    cache.evict()
+    assert not any(os.path.exists(path) for path in entries)
+
+def test_cache_error_is_not_reported_as_missing_input(export, monkeypatch):
+    def vanished():
+        raise FileNotFoundError("запись кэша удалена другим процессом")
+
+    monkeypatch.setattr(cache, "evict", vanished)
+    df = main.preprocess_file(export, use_cache=True)
+    assert df is not None and len(df) == 50
+    assert main.preprocess_file(export, use_cache=True) is not None
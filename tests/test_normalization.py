@@ -0,0 +1,75 @@
+import json
+import pandas as pd
+import pytest
+import config
+import normalization
+from normalization import Normalizer, TrigramIndex
+
+# --- Сопоставление со справочниками ADM_TERR и MED_ORG ---
+# Нормализация включена по умолчанию и меняет МО и территории до классификации,
+# поэтому пороги, правило чисел и синонимы проверяются на настоящих справочниках config.py.
+
+@pytest.fixture(scope="module")
+def indexes():
+    return {kind: TrigramIndex(vocabulary, aliases, config.NORMALIZATION_MIN_SCORE[kind], config.NORMALIZATION_MIN_MARGIN)
+            for kind, (vocabulary, aliases) in normalization.vocabularies().items()}
+
+@pytest.mark.parametrize("kind, value, expected", [
+    ("district", "г. Благовещенск", "Благовещенск"),
+    ("district", "Сковородино", "Сковородинский район"),             # синоним из DISTRICT_NORMALIZATION
+    ("district", "  СКОВОРОДИНО ", "Сковородинский район"),
+    ("med_org", "гауз ао городская поликлиника №3", "ГАУЗ АО Городская поликлиника №3"),
+    ("med_org", "ГАУЗ АО «Городская поликлинника №3»", "ГАУЗ АО Городская поликлиника №3"),
+])
+def test_matches_vocabulary(indexes, kind, value, expected):
+    assert indexes[kind].match(value)[0] == expected
+
+@pytest.mark.parametrize("kind, value", [
+    ("med_org", "ГАУЗ АО Городская поликлиника №12"),   # числа сравниваются точно: не №1 и не №2
+    ("med_org", "ГАУЗ АО Городская поликлиника"),       # ниже NORMALIZATION_MIN_SCORE
+    ("district", "Непонятно"),
+    ("district", "Благовещенский р-н"),                 # Благовещенск и Благовещенский район ближе NORMALIZATION_MIN_MARGIN
+])
+def test_leaves_uncertain_values_unmatched(indexes, kind, value):
+    match, score = indexes[kind].match(value)
+    assert match is None and score < 1.0
+
+def test_margin_between_close_candidates():
+    index = TrigramIndex(["Северный", "Северная"], {}, min_score=0.3, min_margin=0.1)
+    assert index.match("Северн")[0] is None
+    assert index.match("Северный") == ("Северный", 1.0)
+
+def test_normalized_med_org_joins_city_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(normalization, "_normalizer", Normalizer(str(tmp_path / "normalization.json")))
+    df = pd.DataFrame({config.COL_DISTRICT: ["г. Благовещенск", "Тында", None],
+                       config.COL_MED_ORG: ["гауз ао городская поликлиника №1", "ГАУЗ АО Городская поликлиника №12", None]})
+    normalization.normalize_frame(df)
+    assert df[config.COL_DISTRICT].tolist()[:2] == ["Благовещенск", "Тында"]
+    assert df[config.COL_MED_ORG].isin(config.MED_ORG).tolist() == [True, False, False]
+
+# --- Выученные соответствия (normalization.json) ---
+def test_learned_mapping_reused_after_reload(tmp_path):
+    path = str(tmp_path / "normalization.json")
+    first = Normalizer(path)
+    assert first.lookup("district", "г. Благовещенск") == "Благовещенск"
+    first.save()
+
+    second = Normalizer(path)
+    assert second.learned["district"]["г. Благовещенск"][0] == "Благовещенск"
+    second.indexes["district"] = None  # из файла, без повторного поиска по триграммам
+    assert second.lookup("district", "г. Благовещенск") == "Благовещенск"
+
+def test_hand_edited_mapping_is_used(tmp_path):
+    path = tmp_path / "normalization.json"
+    data = {"fingerprint": normalization.fingerprint(), "district": {"Тындинский р-н": ["Тында", 1.0]}, "med_org": {}}
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    assert Normalizer(str(path)).lookup("district", "Тындинский р-н") == "Тында"
+
+def test_learned_mappings_dropped_on_fingerprint_change(tmp_path, monkeypatch):
+    path = str(tmp_path / "normalization.json")
+    normalizer = Normalizer(path)
+    normalizer.lookup("district", "г. Благовещенск")
+    normalizer.save()
+    monkeypatch.setattr(config, "NORMALIZATION_MIN_MARGIN", config.NORMALIZATION_MIN_MARGIN + 0.05)
+    assert normalization.fingerprint() != normalizer.fingerprint
+    assert Normalizer(path).learned["district"] == {}
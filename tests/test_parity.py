@@ -0,0 +1,174 @@
+import os
+from collections import defaultdict
+from collections.abc import Mapping
+import pandas as pd
+import pytest
+import config
+import cache
+import main
+from benchmark import generate_export
+
+# --- Эталон: построчный анализ до векторизации (замороженная копия) ---
+# Новые пути анализа (векторный, потоковый, параллельный, из кэша) сравниваются с ним
+# на синтетической выгрузке из benchmark.generate_export.
+
+EXPORT_ROWS = 400
+
+def get_age_group(age: float) -> str:
+    for (low, high), label in zip(config.AGE_GROUP, config.AGE_GROUP_NAME):
+        if label == config.AGE_GROUP_NAME[-1]:  # последняя группа "65 и старше"
+            if age >= low:
+                return label
+        elif low <= age < high:
+            return label
+    return "Неизвестно"
+
+def classify_status(status: str, age: float | None = None) -> str:
+    status = str(status).strip().lower()
+    for group_name, keywords in config.SOCIAL_GROUPS.items():
+        if status in [kw.lower() for kw in keywords]:
+            if group_name in config.SOCIAL_GROUPS_ADULT_OVERRIDE and age is not None and age >= 18:
+                return config.SOCIAL_GROUP_DEFAULT
+            return group_name
+    for keyword, group in config.KEYWORD_MAPPING.items():
+        if keyword.lower() in status:
+            if group in config.SOCIAL_GROUPS_ADULT_OVERRIDE and age is not None and age >= 18:
+                return config.SOCIAL_GROUP_DEFAULT
+            return group
+    return config.SOCIAL_GROUP_DEFAULT
+
+def classify_med_org(mo_name: str) -> str:
+    if not isinstance(mo_name, str):
+        return "Другие МО"
+    name = mo_name.lower()
+    for org, keywords in config.MED_ORGS.items():
+        for kw in keywords:
+            if kw in name:
+                return org
+    return "Другие МО"
+
+def get_severity(place: str, hosp_date) -> dict:
+    severity = {key: 0 for key in config.SEVERITY_ORDER}
+    place = str(place).strip()
+    category = None
+    for cat, places in config.SEVERITY_CATEGORIES.items():
+        if place in places:
+            category = cat
+            break
+    if category is None:
+        category = config.SEVERITY_DEFAULT
+    severity[f"{category}/всего"] = 1
+    if pd.notna(hosp_date):
+        severity[f"{category}/в т.ч. госпитализировано"] = 1
+    return severity
+
+def increment_count(d: dict, key: str, val: int = 1):
+    d[key] = d.get(key, 0) + val
+
+def reference_population_full(df: pd.DataFrame) -> dict:
+    result = {config.CITY_MAIN: main.new_region_structure(), "Районы": {}}
+    mask_blg = (df[config.COL_DISTRICT] == config.CITY_MAIN) | (df[config.COL_MED_ORG].isin(config.MED_ORG))
+    for idx, row in df.iterrows():
+        is_blg = mask_blg[idx]
+        district = row[config.COL_DISTRICT] if not is_blg else config.CITY_MAIN
+        age_group_label = get_age_group(row["Возраст"])
+        social_group = classify_status(row.get(config.COL_SOCIAL_STATUS, ""), row["Возраст"])
+        severity_counts = get_severity(row.get(config.COL_HOSP_PLACE, ""), row.get(config.COL_HOSP_DATE, pd.NaT))
+        target_dict = result[config.CITY_MAIN] if is_blg else result["Районы"].setdefault(
+            district, main.new_region_structure()
+        )
+        increment_count(target_dict["age"], age_group_label)
+        increment_count(target_dict["social"], social_group)
+        for k, v in severity_counts.items():
+            increment_count(target_dict["severity"], k, v)
+    return result
+
+def reference_by_med_org(df: pd.DataFrame) -> dict:
+    results = defaultdict(lambda: {"age": defaultdict(int), "social": defaultdict(int), "severity": defaultdict(int)})
+    mask_blg = (
+        (df[config.COL_DISTRICT] == config.CITY_MAIN) |
+        df[config.COL_MED_ORG].apply(lambda x: any(org.lower() in str(x).lower() for org in config.MED_ORGS.keys()))
+    )
+    for _, row in df[mask_blg].iterrows():
+        org = classify_med_org(row[config.COL_MED_ORG])
+        age_group = get_age_group(row["Возраст"])
+        results[org]["age"][age_group] += 1
+        results[org]["social"][classify_status(row[config.COL_SOCIAL_STATUS], row["Возраст"])] += 1
+        for key, val in get_severity(row.get(config.COL_HOSP_PLACE, ""), row.get(config.COL_HOSP_DATE)).items():
+            results[org]["severity"][key] += val
+    return results
+
+def plain(data):
+    """Вложенные словари/CountTensor в обычные dict; пустая территория (NaN) - одним ключом"""
+    if isinstance(data, Mapping):
+        return {("nan" if isinstance(key, float) and pd.isna(key) else key): plain(value) for key, value in data.items()}
+    return data
+
+# --- Данные ---
+@pytest.fixture(scope="module")
+def workdir(tmp_path_factory):
+    # кэш и файл нормализации пишутся в текущую папку - уводим их из репозитория
+    path = tmp_path_factory.mktemp("parity")
+    cwd = os.getcwd()
+    os.chdir(path)
+    yield path
+    os.chdir(cwd)
+
+@pytest.fixture(scope="module")
+def export(workdir):
+    path = str(workdir / "report060u.xlsx")
+    generate_export(path, EXPORT_ROWS, seed=7)
+    return path
+
+@pytest.fixture(scope="module")
+def frame(export):
+    return main.preprocess_file(export, use_cache=False)
+
+@pytest.fixture(scope="module")
+def reference(frame):
+    return plain(reference_population_full(frame)), plain(reference_by_med_org(frame))
+
+# --- Тесты ---
+def test_population_full_matches_row_loop(frame, reference):
+    regions = [reference[0][config.CITY_MAIN], *reference[0]["Районы"].values()]
+    assert sum(sum(block["age"].values()) for block in regions) == EXPORT_ROWS
+    assert plain(main.analyze_population_full(frame, workers=1)) == reference[0]
+
+def test_by_med_org_matches_row_loop(frame, reference):
+    assert plain(main.analyze_by_med_org(frame, workers=1)) == reference[1]
+
+def test_analyze_all_matches_row_loop(frame, reference):
+    regions, med_orgs = main.analyze_all(frame, workers=1)
+    assert (plain(regions), plain(med_orgs)) == reference
+
+@pytest.mark.parametrize("chunk_size", [7, 1000])
+def test_stream_matches_row_loop(export, reference, chunk_size):
+    regions, med_orgs = main.analyze_stream(export, chunk_size, workers=1)
+    assert (plain(regions), plain(med_orgs)) == reference
+
+def test_parallel_matches_row_loop(frame, reference):
+    regions, med_orgs = main.count_parallel(frame, workers=2, chunk_rows=50)
+    assert (plain(main.region_result(regions)), plain(med_orgs)) == reference
+
+def test_parallel_stream_matches_row_loop(export, reference, monkeypatch):
+    monkeypatch.setattr(config, "PARALLEL_MIN_ROWS", 1)
+    regions, med_orgs = main.analyze_stream(export, 50, workers=2)
+    assert (plain(regions), plain(med_orgs)) == reference
+
+@pytest.mark.skipif(not cache.is_available(), reason="кэш требует pyarrow")
+def test_cached_frame_matches_row_loop(export, reference):
+    main.preprocess_file(export, use_cache=True)
+    cached = main.preprocess_file(export, use_cache=True)
+    regions, med_orgs = main.analyze_all(cached, workers=1)
+    assert (plain(regions), plain(med_orgs)) == reference
+
+def test_store_matches_row_loop(workdir, frame, reference):
+    from store import AggregateStore
+    store = AggregateStore(str(workdir / "store.sqlite"), rebuild=True)
+    try:
+        store.merge(frame)
+        store.merge(frame)  # повторная выгрузка не меняет счетчики
+        regions, med_orgs = store.structures()
+    finally:
+        store.close()
+    assert (plain(regions), plain(med_orgs)) == reference
@@ -0,0 +1,183 @@
+import argparse
+import datetime
+import os
+import sys
+import pandas as pd
+import config
+from classifiers import OTHER_MED_ORG
+from counts import AGE_GROUP_UNKNOWN
+from main import logger, preprocess_file, classify_frame, detect_fixed_date_format
+
+# --- Динамика заболеваемости по дням и ISO-неделям ---
+# Все счетчики строятся одним groupby по дате и категории, дальше - resample/rolling
+# по индексу дат, поэтому несколько сезонов накопленных выгрузок считаются за секунды.
+# Первая и последняя неделя периода обычно неполные: в таблицах недель они видны по
+# столбцу "Дней в периоде", прирост и сигналы для них не считаются.
+
+TOTAL = "Всего"
+DATE_INDEX = "Дата"
+DIMENSIONS = {
+    "district": ("Территории", lambda: config.ADM_TERR + [config.TIMESERIES_OTHER_DISTRICT]),
+    "med_org": ("МО", lambda: list(dict.fromkeys([*config.MED_ORGS, OTHER_MED_ORG]))),
+    "age_group": ("Возраст", lambda: config.AGE_GROUP_NAME + [AGE_GROUP_UNKNOWN]),
+}
+
+def event_dates(values: pd.Series) -> pd.Series:
+    """Даты событий без времени; текстовые даты - по формату из config.DATE_FORMATS"""
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.to_datetime(values, format=detect_fixed_date_format(values), errors="coerce")
+    return values.dt.normalize()
+
+def load_cases(input_files: list[str], compact: bool = True) -> pd.DataFrame | None:
+    """Предобработанные выгрузки одной таблицей; повторяющиеся ЭИ берутся из более поздней выгрузки"""
+    frames = []
+    for input_file in input_files:
+        df = preprocess_file(input_file, compact=compact)
+        if df is None:
+            return None
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if len(frames) > 1 and config.COL_CASE_ID in df.columns:
+        has_id = df[config.COL_CASE_ID].notna()
+        df = pd.concat([df[has_id].drop_duplicates(config.COL_CASE_ID, keep="last"), df[~has_id]])
+    return df
+
+def case_frame(df: pd.DataFrame, date_column: str = config.TIMESERIES_DATE_COLUMN,
+               since: str | None = None, until: str | None = None) -> pd.DataFrame:
+    """Одна строка на ЭИ: дата события и категории по всем разрезам"""
+    classified = classify_frame(df)
+    # территория пациента, а не строка отчета по области: там случаи МО из MED_ORG отнесены к Благовещенску
+    district = df[config.COL_DISTRICT].astype(object)
+    cases = pd.DataFrame({
+        "date": event_dates(df[date_column]),
+        "district": district.where(district.isin(config.ADM_TERR), config.TIMESERIES_OTHER_DISTRICT),
+        "med_org": classified["med_org"],
+        "age_group": classified["age_group"],
+    })
+    # явные ошибки в датах (будущее, опечатки в годе) растянули бы ряд на десятилетия
+    until = pd.Timestamp(until) if until else pd.Timestamp(datetime.date.today())
+    valid = cases["date"].notna() & (cases["date"] <= until)
+    if since:
+        valid &= cases["date"] >= pd.Timestamp(since)
+    dropped = len(cases) - int(valid.sum())
+    if dropped:
+        logger.warning(f"Пропущено записей без даты или с датой вне периода ({date_column}): {dropped}")
+    cases = cases[valid]
+    for column, (_, order) in DIMENSIONS.items():
+        cases[column] = pd.Categorical(cases[column], categories=order())
+    return cases
+
+def daily_counts(cases: pd.DataFrame, column: str) -> pd.DataFrame:
+    """Случаи по дням (строки - каждый день периода, включая дни без случаев) и категориям"""
+    counts = cases.groupby(["date", column], observed=False).size().unstack(fill_value=0)
+    counts = counts.asfreq("D", fill_value=0)
+    counts.columns = counts.columns.astype(str)
+    counts.index.name = DATE_INDEX
+    counts[TOTAL] = counts.sum(axis=1)
+    return counts
+
+def weekly_counts(daily: pd.DataFrame) -> pd.DataFrame:
+    """Суммы по ISO-неделям; индекс - понедельник недели"""
+    return daily.resample("W-MON", label="left", closed="left").sum()
+
+def week_days(daily: pd.DataFrame) -> pd.Series:
+    """Сколько дней каждой ISO-недели попало в период; у первой и последней недели бывает меньше 7"""
+    return pd.Series(1, index=daily.index).resample("W-MON", label="left", closed="left").sum()
+
+def rolling_counts(daily: pd.DataFrame, days: int = config.TIMESERIES_ROLLING_DAYS) -> pd.DataFrame:
+    return daily.rolling(days, min_periods=1).sum().astype(int)
+
+def week_growth(weekly: pd.DataFrame, days: pd.Series | None = None) -> pd.DataFrame:
+    """Прирост к предыдущей неделе (0.5 = +50%); пусто, если на прошлой неделе случаев не было,
+    а при заданных days (week_days) - и если одна из двух недель попала в период не целиком"""
+    previous = weekly.shift(1)
+    growth = (weekly - previous) / previous.where(previous > 0)
+    if days is not None:
+        # неполная неделя (выгрузка началась в воскресенье или оборвалась в среду) дала бы ложный рост или спад
+        complete = (days == 7) & (days.shift(1) == 7)
+        growth = growth.where(complete, axis=0)
+    return growth
+
+def week_alerts(weekly: pd.DataFrame, growth: pd.DataFrame, dimension: str) -> pd.DataFrame:
+    """Недели, когда по категории рост не меньше TIMESERIES_ALERT_GROWTH при достаточном числе случаев"""
+    hit = (growth >= config.TIMESERIES_ALERT_GROWTH) & (weekly >= config.TIMESERIES_ALERT_MIN_CASES)
+    weeks, categories = hit.to_numpy().nonzero()
+    return pd.DataFrame({
+        "Неделя": [iso_week(weekly.index[i]) for i in weeks],
+        "Разрез": DIMENSIONS[dimension][0],
+        "Категория": weekly.columns[categories],
+        "Случаев": weekly.to_numpy()[weeks, categories],
+        "Прошлая неделя": weekly.shift(1).to_numpy()[weeks, categories].astype(int),
+        "Прирост, %": (growth.to_numpy()[weeks, categories] * 100).round(1),
+    })
+
+def iso_week(day: pd.Timestamp) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def _by_week(table: pd.DataFrame, days: pd.Series) -> pd.DataFrame:
+    table = table.copy()
+    table.insert(0, "Неделя", [iso_week(day) for day in table.index])
+    table.insert(1, "Дней в периоде", days.reindex(table.index).astype(int))
+    return table
+
+def build_tables(cases: pd.DataFrame, days: int = config.TIMESERIES_ROLLING_DAYS) -> dict[str, pd.DataFrame]:
+    """Таблицы для листов/CSV: по каждому разрезу дни, скользящая сумма, недели, прирост; плюс сигналы"""
+    tables, alerts = {}, []
+    for column, (title, _) in DIMENSIONS.items():
+        daily = daily_counts(cases, column)
+        weekly = weekly_counts(daily)
+        in_period = week_days(daily)
+        growth = week_growth(weekly, in_period)
+        tables[f"{title} - дни"] = daily
+        tables[f"{title} - {days} дн"] = rolling_counts(daily, days)
+        tables[f"{title} - недели"] = _by_week(weekly, in_period)
+        tables[f"{title} - прирост"] = _by_week((growth * 100).round(1), in_period)
+        alerts.append(week_alerts(weekly, growth, column))
+    tables["Сигналы"] = pd.concat(alerts, ignore_index=True).sort_values(["Неделя", "Разрез"], kind="stable")
+    return tables
+
+def write_xlsx(tables: dict[str, pd.DataFrame], path: str):
+    with pd.ExcelWriter(path) as writer:
+        for name, table in tables.items():
+            table.to_excel(writer, sheet_name=name[:31], index=table.index.name == DATE_INDEX)
+    logger.info(f"Динамика сохранена в {path}")
+
+def write_csv(tables: dict[str, pd.DataFrame], out_dir: str):
+    os.makedirs(out_dir, exist_ok=True)
+    for name, table in tables.items():
+        path = os.path.join(out_dir, f"{name.replace(' - ', '_').replace(' ', '_')}.csv")
+        table.to_csv(path, index=table.index.name == DATE_INDEX, encoding="utf-8-sig")
+    logger.info(f"Динамика (CSV) сохранена в {out_dir}")
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Динамика заболеваемости по дням и неделям")
+    parser.add_argument("input_files", nargs="+", help="выгрузки Report060U (можно за несколько сезонов)")
+    parser.add_argument("--date", choices=["submit", "onset"], default=None,
+                        help="по дате подачи ЭИ или дате заболевания (по умолчанию TIMESERIES_DATE_COLUMN)")
+    parser.add_argument("--since", help="начало периода, ГГГГ-ММ-ДД")
+    parser.add_argument("--until", help="конец периода, ГГГГ-ММ-ДД (по умолчанию сегодня)")
+    parser.add_argument("--rolling", type=int, default=config.TIMESERIES_ROLLING_DAYS, help="окно скользящей суммы, дней")
+    parser.add_argument("--out", default=config.TIMESERIES_FILE, help="книга xlsx с листами по разрезам")
+    parser.add_argument("--csv", metavar="DIR", help="дополнительно сохранить таблицы в CSV в эту папку")
+    args = parser.parse_args(argv)
+
+    date_column = {"submit": config.COL_SUBMIT_DATE, "onset": config.COL_ONSET_DATE}.get(args.date,
+                                                                                         config.TIMESERIES_DATE_COLUMN)
+    df = load_cases(args.input_files)
+    if df is None:
+        return 1
+    cases = case_frame(df, date_column, args.since, args.until)
+    if cases.empty:
+        logger.error("Нет записей с датами в выбранном периоде")
+        return 1
+    tables = build_tables(cases, args.rolling)
+    logger.info(f"Случаев: {len(cases)}, период {cases['date'].min():%d.%m.%Y} - {cases['date'].max():%d.%m.%Y}, "
+                f"сигналов: {len(tables['Сигналы'])}")
+    write_xlsx(tables, args.out)
+    if args.csv:
+        write_csv(tables, args.csv)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())